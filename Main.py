@@ -1,15 +1,36 @@
 import os
 import json
+import bz2
+import gzip
+import hashlib
+import heapq
+import lzma
+import math
+import mmap
+import numpy as np
 import pandas as pd
 import re
 import logging
+import time
 import traceback
 # import sys
+from concurrent.futures import ProcessPoolExecutor
 from datetime import datetime
+from functools import lru_cache
 from openpyxl.styles import PatternFill, Font, Alignment
 from openpyxl.utils import get_column_letter
 from openpyxl.formatting.rule import ColorScaleRule, CellIsRule
 
+# Быстрые парсеры JSON — необязательные зависимости (см. JSON_BACKEND)
+try:
+    import orjson
+except ImportError:
+    orjson = None
+try:
+    import simdjson
+except ImportError:
+    simdjson = None
+
 # --- Параметры логирования ---
 # LOG_LEVEL определяет глубину вывода в консоль (INFO или DEBUG)
 LOG_LEVEL = logging.INFO
@@ -22,9 +43,18 @@ SOURCE_DIR = "//Users//orionflash//Desktop//MyProject//LeaderForAdmin_skript//JS
 TARGET_DIR = "//Users//orionflash//Desktop//MyProject//LeaderForAdmin_skript//XLSX"
 LOG_DIR = "//Users//orionflash//Desktop//MyProject//LeaderForAdmin_skript//LOGS"
 LOG_BASENAME = "LOG_INFO"
+CACHE_DIR = "//Users//orionflash//Desktop//MyProject//LeaderForAdmin_skript//CACHE"
 BEFORE_FILENAME = "leadersForAdmin_SIGMA_20250901-134037.json"
 AFTER_FILENAME = "leadersForAdmin_SIGMA_20250922-094911.json"
 RESULT_EXCEL = "LFA_COMPARE.xlsx"
+
+# --- Режим динамики (несколько выгрузок за один запуск) ---
+# Упорядоченный список выгрузок в SOURCE_DIR (от старой к новой). Если задано две и более,
+# вместо пары BEFORE_FILENAME/AFTER_FILENAME сравниваются все соседние выгрузки,
+# каждая разбирается один раз; для каждой пары создаётся своя книга Excel.
+TIMELINE_FILENAMES = []
+# Дополнительно сравнить первую выгрузку с последней
+TIMELINE_FIRST_TO_LAST = True
 # === Параметры справочников турниров и конкурсов ===
 CATALOG_DIR = "//Users//orionflash//Desktop//MyProject//LeaderForAdmin_skript//CSV"
 TOURNAMENT_SCHEDULE_CSV = "TOURNAMENT-SCHEDULE (PROM) 2025-09-19 v2.csv"
@@ -55,6 +85,105 @@ ALLOWED_TOURNAMENT_IDS = [
 # Если False, то всегда грузятся все турниры
 FILTER_TOURNAMENTS_IN_BEFORE_AFTER = True
 
+# --- Потоковый разбор JSON-выгрузок ---
+# Если True, большие файлы (см. JSON_STREAMING_MIN_MB) читаются по одному турниру верхнего уровня за раз:
+# в памяти находится только текст и объекты текущего турнира, а не весь файл.
+# Если False, файл всегда целиком загружается через json.load (прежнее поведение).
+# Потоковый разбор расходует примерно в 1,8 раза меньше памяти, но в 1,3–1,9 раза медленнее json.load
+# (выгрузка 240 МБ: ~0,66 ГБ против ~1,2 ГБ).
+JSON_STREAMING = True
+# Потоковый разбор включается только для файлов не меньше этого размера на диске (МБ);
+# файлы меньше загружаются целиком через json.load. Сжатые выгрузки разбираются потоком
+# всегда: размер распакованного текста заранее неизвестен. 0 — потоком все файлы.
+JSON_STREAMING_MIN_MB = 512
+# Размер блока чтения файла при потоковом разборе (в байтах)
+JSON_STREAM_CHUNK_SIZE = 1024 * 1024
+# Поля лидера, значения которых пропускаются при потоковом чтении без декодирования
+# (в строку лидера они всё равно не попадают, см. flatten_leader)
+JSON_SKIP_FIELDS = ["photoData"]
+# Сжатые выгрузки (.json.gz, .json.bz2, .json.xz) распаковываются потоком во время разбора,
+# распакованный JSON на диск не пишется. Формат определяется по сигнатуре файла, затем по расширению.
+JSON_COMPRESSION_EXTENSIONS = {".gz": "gzip", ".gzip": "gzip", ".bz2": "bz2", ".xz": "xz", ".lzma": "xz"}
+# Парсер JSON: "auto" — самый быстрый из установленных (orjson, затем simdjson), иначе стандартный json;
+# "orjson", "simdjson", "json" — конкретный парсер (если он не установлен — стандартный json с предупреждением).
+# Если быстрый парсер не принимает блок (NaN, целые больше 64 бит), блок разбирается стандартным json.
+JSON_BACKEND = "auto"
+# Если True, несжатые выгрузки читаются из отображённого в память файла (mmap), без копирования в строку Python
+JSON_USE_MMAP = True
+# Если True, перед загрузкой замеряется скорость разбора BEFORE каждым доступным парсером (MB/s в лог)
+JSON_BACKEND_BENCHMARK = False
+# Число повторов замера (берётся лучшее время)
+JSON_BACKEND_BENCHMARK_REPEATS = 3
+
+# --- Параллельная загрузка BEFORE/AFTER ---
+# Если True, файлы BEFORE и AFTER разбираются одновременно в пуле процессов.
+# Результат (строки, колонки, типы, порядок) совпадает с последовательной загрузкой.
+PARALLEL_LOAD = False
+# Число процессов пула (None — по числу ядер, но не больше числа частей)
+PARALLEL_LOAD_WORKERS = None
+# На сколько частей делить каждый файл по турнирам верхнего уровня (1 — не делить).
+# Части — непрерывные диапазоны турниров, поэтому при склейке порядок строк сохраняется.
+# Деление работает только для файлов, которые разбираются потоком (JSON_STREAMING, JSON_STREAMING_MIN_MB).
+PARALLEL_LOAD_FILE_SHARDS = 1
+
+# --- Нормализация числовых полей при загрузке ---
+# Сколько различных строковых форм чисел запоминать при массовом разборе колонок
+NUMERIC_PARSE_MEMO_SIZE = 65536
+# Сводка ошибок разбора: сколько примеров значений хранить на пару поле/турнир и их максимальная длина
+PARSE_DIAG_MAX_SAMPLES = 5
+PARSE_DIAG_SAMPLE_LENGTH = 50
+
+# --- Кэш разобранных выгрузок (снимков) ---
+# Если True, DataFrame каждой выгрузки после разбора сохраняется в CACHE_DIR (по колонкам, файл .npz).
+# Ключ снимка — хэш содержимого файла и подпись параметров разбора, поэтому
+# выгрузка, которая на прошлой неделе была AFTER, на этой неделе как BEFORE не разбирается заново.
+# Ошибки разбора выгрузки (записи, лидеры, числа) хранятся в снимке и снова выводятся в лог
+# при каждой загрузке из кэша.
+SNAPSHOT_CACHE_ENABLED = True
+# Максимальный суммарный размер снимков в CACHE_DIR (МБ); старые (по последнему использованию) удаляются
+SNAPSHOT_CACHE_MAX_MB = 1024
+# Версия разбора: увеличить при изменении логики загрузки, чтобы старые снимки не использовались
+SNAPSHOT_PARSER_VERSION = 2
+
+# --- Компактное хранение BEFORE/AFTER/COMPARE в памяти ---
+# Если True, после загрузки (и после построения COMPARE) повторяющиеся строковые колонки
+# хранятся как category, места и groupId — как Int32, вещественные — как float32,
+# если значение восстанавливается без потерь. Перед сравнением и экспортом исходные
+# типы восстанавливаются (restore_frame_dtypes), поэтому Excel-файл не меняется.
+COMPACT_DTYPES = True
+# Строковая колонка переводится в category, если уникальных значений не больше этой доли строк
+COMPACT_CATEGORY_MAX_RATIO = 0.5
+
+# --- Листы исходных данных BEFORE/AFTER ---
+# "full" — в строки попадают все поля лидера, листы BEFORE/AFTER выгружаются целиком (прежнее поведение);
+# "slim" — при разборе извлекаются только поля, нужные отчёту (PRIORITY_COLS, COMPARE_KEYS,
+#          COMPARE_FIELDS, FLOAT_FIELDS и divisionRatings_*), листы выгружаются в сокращённом виде;
+# "skip" — то же извлечение, листы BEFORE/AFTER в Excel не выгружаются.
+RAW_SHEETS_MODE = "full"
+RAW_SHEETS_MODES = ("full", "slim", "skip")
+
+# --- Колонка 'Итого' листа COMPARE ---
+# Если True, длинный текст 'Итого' собирается только при экспорте COMPARE в Excel
+# и не хранится в таблице сравнения на этапах FINAL/FINAL_PLACE.
+COMPARE_SUMMARY_LAZY = False
+
+# --- Турниры без изменений ---
+# При загрузке для каждого турнира считается контрольная сумма его строк по COMPARE_KEYS
+# и COMPARE_FIELDS. Турниры с одинаковой суммой в BEFORE и AFTER не сравниваются построчно:
+# их строки сопоставляются по порядку и получают статусы «без изменений» сразу.
+COMPARE_SKIP_UNCHANGED_TOURNAMENTS = True
+# Поля, которые не входят в контрольную сумму (имя файла выгрузки отличается всегда)
+TOURNAMENT_DIGEST_IGNORE_FIELDS = ['SourceFile']
+
+# --- Параллельное сравнение по турнирам ---
+# Если True, make_compare_sheet делит BEFORE/AFTER на части по tournamentId и сравнивает
+# их в пуле процессов. Строки, колонки, типы и порядок совпадают с последовательным сравнением.
+PARALLEL_COMPARE = False
+# Число процессов пула (None — по числу ядер, но не больше числа турниров)
+PARALLEL_COMPARE_WORKERS = None
+# Частей на процесс: турниры разного размера распределяются по частям ровнее
+PARALLEL_COMPARE_SHARDS_PER_WORKER = 4
+
 LOG_MESSAGES = {
     "LOGGER_SESSION_START": "\n-------- NEW LOG START AT {date} ({time}) -------\n",
     "LOGGER_ACTIVE_FILE": "Лог-файл активен (append): {path}",
@@ -67,14 +196,45 @@ LOG_MESSAGES = {
     "COMPARE_COLUMN_COUNTS": "[COMPARE] {col}: {counts}",
     "PARSE_FLOAT_ERROR": "[parse_float] Ошибка преобразования '{val}' в float: {ex} | Context: {context}",
     "PARSE_INT_ERROR": "[parse_int] Ошибка преобразования '{val}' в int: {ex} | Context: {context}",
+    "PARSE_DIAG_SUMMARY": "[parse_diag] {filename}: не удалось преобразовать значений: {total} (полей: {fields}, турниров: {tournaments}); по полям и турнирам: {summary}",
     "FLATTEN_LEADER_START": "Начата обработка лидера: employee={employee} для турнира {tournament_id}, файл {source_file}",
     "PROCESS_JSON_LOAD_ERROR": "Ошибка загрузки файла {filepath}: {ex}",
+    "JSON_BACKEND_SELECTED": "[json] Парсер JSON: {backend} (JSON_BACKEND = {requested}, доступны: {available}), mmap: {use_mmap}",
+    "JSON_BACKEND_UNAVAILABLE": "[json] Парсер {requested} не установлен или неизвестен, используется {backend}",
+    "JSON_BACKEND_FALLBACK": "[json] Парсер {backend} не принял данные ({ex}); такие данные разбираются стандартным json (сообщение выводится один раз)",
+    "JSON_BACKEND_BENCHMARK": "[json] Замер {filename}: {backend} — {mb:.1f} MB за {seconds:.3f} сек., {mb_per_s:.1f} MB/s",
+    "PROCESS_JSON_SOURCE_DONE": "[process_json_file] {filename}: формат {compression}, на диске {disk_mb:.1f} MB, загрузка {seconds:.2f} сек.",
+    "PROCESS_JSON_STREAM_ERROR": "Ошибка потокового разбора файла {filepath} после {tournaments} турниров ({rows} строк уже прочитано), загрузка прервана: {ex}",
+    "PROCESS_JSON_FRAME_DONE": "[process_json_file] {filename}: собран DataFrame {n_rows} x {n_cols}, колонки вне схемы: {overflow}",
+    "PROCESS_JSON_FILTER_SKIPPED": "[process_json_file] {filename}: при разборе пропущены турниры вне ALLOWED_TOURNAMENT_IDS: {tournaments}, строк {rows}",
+    "PROCESS_JSON_STREAM_DONE": "[process_json_file] Потоковый разбор {filename}: турниров {tournaments}, строк {rows}, макс. размер турнира {max_block_kb:.1f} KB",
+    "PROCESS_JSON_DUPLICATE_KEY": "[process_json_file] {filename}: ключ турнира {tournament_key!r} встречается в файле повторно, файл разбирается заново целиком через json.load (берётся последнее значение ключа)",
+    "SNAPSHOT_HIT": "[snapshot] {filename}: загружен снимок из кэша {path} ({size_mb:.1f} MB)",
+    "SNAPSHOT_MISS": "[snapshot] {filename}: снимка в кэше нет, файл разбирается",
+    "SNAPSHOT_SAVED": "[snapshot] {filename}: снимок сохранён {path} ({size_mb:.1f} MB)",
+    "SNAPSHOT_EVICTED": "[snapshot] Удалён старый снимок {path} ({size_mb:.1f} MB), лимит кэша {limit_mb} MB",
+    "SNAPSHOT_ERROR": "[snapshot] Ошибка кэша снимков для {filename}: {ex}",
+    "SNAPSHOT_LOAD_ERRORS": "[snapshot] {filename}: при разборе файла, сохранённого в снимке, были ошибки: {errors}; турниры с пропущенными записями или лидерами: {tournaments}",
+    "COMPACT_FRAME_DONE": "[compact] {label}: память {before_mb:.1f} MB -> {after_mb:.1f} MB; колонки: {columns}",
+    "RAW_SHEETS_MODE_UNKNOWN": "[MAIN] Неизвестный RAW_SHEETS_MODE={mode!r} (допустимо: {modes}), используется 'full'",
+    "MAIN_RAW_SHEETS_SKIPPED": "[MAIN] Листы {sheets} не выгружаются (RAW_SHEETS_MODE='skip').",
+    "PARALLEL_LOAD_START": "[parallel_load] Параллельная загрузка файлов: {files}; частей: {tasks}, процессов: {workers}",
+    "PARALLEL_LOAD_WORKER_DONE": "[parallel_load] {filename} часть {shard}/{shards}: строк {rows}, {seconds:.2f}s (процесс {pid})",
+    "PARALLEL_LOAD_FILE_DONE": "[parallel_load] {filename}: загружено за {seconds:.2f}s (сборка частей {merge_seconds:.2f}s)",
+    "PARALLEL_LOAD_FALLBACK": "[parallel_load] Пул процессов недоступен ({ex}), файлы загружаются последовательно",
+    "PARALLEL_LOAD_SPLIT_FALLBACK": "[parallel_load] {filename}: части файла не сошлись или не разобрались ({ex}), файл разбирается заново одной частью",
+    "PARALLEL_COMPARE_START": "[parallel_compare] Турниров: {tournaments}, частей: {shards}, процессов: {workers}",
+    "PARALLEL_COMPARE_WORKER_DONE": "[parallel_compare] Часть {shard}/{shards}: {rows} строк за {seconds:.2f} сек (pid {pid})",
+    "PARALLEL_COMPARE_DONE": "[parallel_compare] Части склеены: {rows} строк, всего {seconds:.2f} сек",
+    "PARALLEL_COMPARE_FALLBACK": "[parallel_compare] Пул процессов недоступен ({ex}), сравнение выполняется последовательно",
     "PROCESS_JSON_BAD_RECORD": "[process_json_file] Некорректная запись в турнире {tournament_key}: {record}",
     "PROCESS_JSON_EMPTY_LEADERS": "Турнир {tournament_id} из файла {filename}: leaders пуст, добавлена заглушка",
     "PROCESS_JSON_FLATTEN_LEADER_ERROR": "[flatten_leader] Ошибка обработки лидера в файле {filename} турнир {tournament_id} employee {employee}: {ex}",
     "PROCESS_JSON_RECORD_ERROR": "[process_json_file] Ошибка обработки записи в файле {filename}, турнир {tournament_key}: {ex}",
     "LOAD_JSON_NO_DATA": "Нет данных для экспорта из папки {folder}",
     "COMPARE_SHEET_START":    "[COMPARE] Построение листа сравнения...",
+    "CATEGORY_TRANSITIONS_GAP": "[COMPARE] В category_compare_lookup нет переходов для ключей (before_present, before_rank, after_present, after_rank): {keys}",
+    "CATEGORY_TRANSITIONS_READY": "[COMPARE] Таблица переходов категорий: рангов {ranks}, переходов {size}x{size}",
     "COMPARE_SHEET_FILTERED": "[COMPARE] После фильтрации по tournamentId: {count} строк.",
     "COMPARE_SHEET_FINAL":    "[COMPARE] После фильтрации строк без изменений: {count} строк.",
     "SMART_TABLE_EXPORT_START":   "[EXPORT] Экспорт листа {sheet} в Excel...",
@@ -103,10 +263,8 @@ LOG_MESSAGES = {
     "COND_FMT_START": "[{sheet}] Применяется условное форматирование для колонок с префиксами {prefixes}",
     "COND_FMT_COL":   "[{sheet}] Применено условное форматирование для колонки '{col}'",
     "COND_FMT_FINISH": "[{sheet}] Завершено условное форматирование для всех колонок с префиксами {prefixes}",
-    "MAIN_BEFORE_READ": "[MAIN] Читаем {sheet}: {path}",
-    "MAIN_BEFORE_LOADED": "[MAIN] Загружено {count} строк из {sheet}.",
-    "MAIN_AFTER_READ": "[MAIN] Читаем {sheet}: {path}",
-    "MAIN_AFTER_LOADED": "[MAIN] Загружено {count} строк из {sheet}.",
+    "MAIN_SNAPSHOT_READ": "[MAIN] Читаем {sheet}: {path}",
+    "MAIN_SNAPSHOT_LOADED": "[MAIN] Загружено {count} строк из {sheet}.",
     "MAIN_TOURNAMENTS_INFO": "[MAIN] Турниров в {sheet_before}: {before_count}, в {sheet_after}: {after_count}",
     "MAIN_TOURNAMENTS_NEW": "[MAIN] Новые турниры (только в {sheet_after}): {count} -> {ids}",
     "MAIN_TOURNAMENTS_REMOVED": "[MAIN] Удалённые турниры (только в {sheet_before}): {count} -> {ids}",
@@ -126,7 +284,14 @@ LOG_MESSAGES = {
     "MAIN_FINAL_SET_ACTIVE_SHEET_FAIL": "[MAIN] Не удалось установить лист {sheet} активным: {ex}",
     "MAIN_TOURNAMENT_DESCRIPTIONS_LOADED": "[MAIN] Загружено описаний турниров: {count}",
     "COMPARE_STATUS_DESCRIPTION_ADDED": "[COMPARE] Добавлены подробные описания статусов наград",
-    "COMPARE_SUMMARY_ADDED": "[COMPARE] Добавлены итоговые строки с описанием изменений"
+    "COMPARE_SUMMARY_ADDED": "[COMPARE] Добавлены итоговые строки с описанием изменений",
+    "COMPARE_SUMMARY_DEFERRED": "[COMPARE] Итоговые строки будут собраны при экспорте (COMPARE_SUMMARY_LAZY)",
+    "TIMELINE_START": "[TIMELINE] Режим динамики: выгрузок {files}, пар для сравнения {pairs}",
+    "TIMELINE_PAIR_START": "[TIMELINE] Пара {pair}/{pairs}: {before} -> {after}",
+    "TIMELINE_SNAPSHOT_RELEASED": "[TIMELINE] Выгрузка {name} больше не нужна и освобождена",
+    "TIMELINE_DONE": "[TIMELINE] Сравнено пар: {pairs} за {seconds:.2f} сек",
+    "TOURNAMENT_DIGESTS_DONE": "[DIGEST] {label}: контрольные суммы посчитаны для {count} турниров за {seconds:.2f} сек",
+    "COMPARE_UNCHANGED_TOURNAMENTS": "[COMPARE] Турниров без изменений (совпали контрольные суммы): {count} из {total}, их строки сопоставляются по порядку без проверки значений (==/>)"
 }
 
 # Шаблон итоговой строки
@@ -503,6 +668,18 @@ def setup_logger(log_dir, basename):
     logging.info(LOG_MESSAGES["LOGGER_ACTIVE_FILE"].format(path=log_path))
     return logger
 
+def is_debug_logging_enabled():
+    """
+    True, если DEBUG-записи реально попадут в лог: корневой логгер пропускает DEBUG
+    и хотя бы один обработчик настроен на DEBUG (setup_logger ставит логгеру DEBUG,
+    а обработчикам — LOG_LEVEL, поэтому одной проверки логгера недостаточно).
+    """
+    root = logging.getLogger()
+    if not root.isEnabledFor(logging.DEBUG):
+        return False
+    return any(handler.level <= logging.DEBUG for handler in root.handlers)
+
+
 def log_data_stats(df, label):
     if df.empty:
         logging.info(LOG_MESSAGES["DATAFRAME_EMPTY"].format(label=label))
@@ -529,24 +706,48 @@ def log_compare_stats(compare_df):
             logging.info(LOG_MESSAGES["COMPARE_COLUMN_COUNTS"].format(col=col, counts=counts))
 
 
+# --- Разбор чисел: общие шаблоны для parse_float/parse_int и массовой нормализации ---
+_NUMBER_SPACES_RE = re.compile(r'[\s\u00A0\u2009]')
+_FLOAT_JUNK_RE = re.compile(r"[^\d.,\-]")
+_INT_JUNK_RE = re.compile(r"[^\d\-]")
+_NULL_STRINGS = {'', 'none', 'null'}
+# Тип каждого значения колонки (для разбора групп значений одного типа)
+_VALUE_TYPE = np.frompyfunc(type, 1, 1)
+
+
+def _parse_float_value(val):
+    """Ядро parse_float: float (округление до 3 знаков) или None; при ошибке — исключение."""
+    if val is None or (isinstance(val, str) and val.strip().lower() in _NULL_STRINGS):
+        return None
+    if isinstance(val, (int, float)):
+        return round(float(val), 3)
+    s = _NUMBER_SPACES_RE.sub('', str(val))
+    s = _FLOAT_JUNK_RE.sub('', s)
+    if s.count(',') > 0 and s.count('.') > 0:
+        if s.rfind('.') > s.rfind(','):
+            s = s.replace(',', '')
+        else:
+            s = s.replace('.', '').replace(',', '.')
+    else:
+        s = s.replace(',', '.')
+    return round(float(s), 3)
+
+
+def _parse_int_value(val):
+    """Ядро parse_int: int или None; при ошибке — исключение."""
+    if val is None or (isinstance(val, str) and val.strip().lower() in _NULL_STRINGS):
+        return None
+    if isinstance(val, int):
+        return val
+    s = _NUMBER_SPACES_RE.sub('', str(val))
+    s = _INT_JUNK_RE.sub('', s)
+    return int(s)
+
+
 def parse_float(val, context=None):
     """Преобразует значение в float, если возможно."""
     try:
-        if val is None or (isinstance(val, str) and val.strip().lower() in {'', 'none', 'null'}):
-            return None
-        if isinstance(val, (int, float)):
-            return round(float(val), 3)
-        s = str(val)
-        s = re.sub(r'[\s\u00A0\u2009]', '', s)
-        s = re.sub(r"[^\d.,\-]", "", s)
-        if s.count(',') > 0 and s.count('.') > 0:
-            if s.rfind('.') > s.rfind(','):
-                s = s.replace(',', '')
-            else:
-                s = s.replace('.', '').replace(',', '.')
-        else:
-            s = s.replace(',', '.')
-        return round(float(s), 3)
+        return _parse_float_value(val)
     except Exception as ex:
         logging.error(
             LOG_MESSAGES["PARSE_FLOAT_ERROR"].format(val=val, ex=ex, context=context)
@@ -557,14 +758,7 @@ def parse_float(val, context=None):
 def parse_int(val, context=None):
     """Преобразует значение в int, если возможно."""
     try:
-        if val is None or (isinstance(val, str) and val.strip().lower() in {'', 'none', 'null'}):
-            return None
-        if isinstance(val, int):
-            return val
-        s = str(val)
-        s = re.sub(r'[\s\u00A0\u2009]', '', s)
-        s = re.sub(r"[^\d\-]", "", s)
-        return int(s)
+        return _parse_int_value(val)
     except Exception as ex:
         logging.error(
             LOG_MESSAGES["PARSE_INT_ERROR"].format(val=val, ex=ex, context=context)
@@ -572,14 +766,121 @@ def parse_int(val, context=None):
         return None
 
 
-def flatten_leader(leader, tournament_id, source_file):
-    """Разворачивает запись лидера в плоскую структуру для DataFrame."""
-    employee = leader.get('employeeNumber', 'N/A')
-    context = f"файл={source_file}, турнир={tournament_id}, employee={employee}"
+def _round_float_array(values):
+    """
+    round(x, 3) для массива float64 с точностью до бита (как в parse_float).
+    rint(x * 1000) / 1000 совпадает с round(x, 3), если x * 1000 не лежит у середины между
+    целыми (там сказывается ошибка умножения); такие значения, бесконечности и очень большие
+    числа округляются через round по одному.
+    """
+    with np.errstate(over='ignore', invalid='ignore'):
+        scaled = values * 1000.0
+        rounded = np.rint(scaled) / 1000.0
+        exact = (np.abs(scaled) < 2.0 ** 52) & (
+            np.abs(np.abs(scaled - np.floor(scaled)) - 0.5) > 4 * np.spacing(np.abs(scaled)))
+    slow = np.flatnonzero(~exact)
+    if len(slow):
+        rounded[slow] = [round(v, 3) for v in values[slow].tolist()]
+    return rounded
+
+
+@lru_cache(maxsize=NUMERIC_PARSE_MEMO_SIZE)
+def _parse_number_memo(text, as_int):
+    """Разбор одной строковой формы числа с запоминанием: (результат, признак ошибки)."""
+    try:
+        return (_parse_int_value(text) if as_int else _parse_float_value(text)), False
+    except Exception:
+        return None, True
+
+
+def normalize_numeric_values(values, as_int=False):
+    """
+    Массовая нормализация значений числовой колонки — та же семантика, что у
+    parse_int (as_int=True) или parse_float (as_int=False) для каждого значения.
+
+    Одинаковые значения разбираются один раз: колонка делится по типам значений,
+    строки, числа и bool факторизуются внутри своей группы, и разбираются только уникальные
+    значения (строковые формы — с запоминанием между колонками и файлами). None остаётся None,
+    значения прочих типов (словари, списки) разбираются по одному.
+    Ошибки не логируются по одной, а возвращаются маской.
+
+    Returns:
+        (result, failed): result — список значений (float/int/None) той же длины,
+        failed — np.ndarray[bool], True там, где значение не удалось преобразовать
+    """
+    n = len(values)
+    if not n:
+        return [], np.zeros(0, dtype=bool)
+    arr = np.empty(n, dtype=object)
+    arr[:] = values
+    parse_value = _parse_int_value if as_int else _parse_float_value
+    kind_codes, kinds = pd.factorize(_VALUE_TYPE(arr))
+    result = np.empty(n, dtype=object)
+    failed = np.zeros(n, dtype=bool)
+    for k, kind in enumerate(kinds):
+        rows = np.flatnonzero(kind_codes == k) if len(kinds) > 1 else slice(None)
+        group = arr[rows]
+        if kind is type(None):
+            continue
+        if kind not in (str, int, float, bool):
+            # Словари, списки и прочее — по одному значению
+            for i, v in zip(np.arange(n)[rows].tolist(), group.tolist()):
+                try:
+                    result[i] = parse_value(v)
+                except Exception:
+                    failed[i] = True
+            continue
+        if kind is int and as_int:
+            result[rows] = group
+            continue
+        if kind is float and not as_int:
+            result[rows] = _round_float_array(group.astype(np.float64)).tolist()
+            continue
+        if kind is float:
+            # Факторизация по битам: -0.0 и 0.0 (а также разные NaN) разбираются отдельно
+            codes, bits = pd.factorize(group.astype(np.float64).view(np.int64))
+            uniques = bits.view(np.float64).tolist()
+        else:
+            codes, uniques = pd.factorize(group, use_na_sentinel=False)
+            uniques = uniques.tolist()
+        if kind is str:
+            parsed = [_parse_number_memo(v, as_int) for v in uniques]
+        else:
+            parsed = []
+            for v in uniques:
+                try:
+                    parsed.append((parse_value(v), False))
+                except Exception:
+                    parsed.append((None, True))
+        unique_values = np.empty(len(parsed), dtype=object)
+        unique_values[:] = [value for value, _ in parsed]
+        result[rows] = unique_values[codes]
+        failed[rows] = np.array([bad for _, bad in parsed], dtype=bool)[codes]
+    return result.tolist(), failed
+
+
+def flatten_leader(leader, tournament_id, source_file, parse_numbers=True, log_debug=None, fields=None):
+    """
+    Разворачивает запись лидера в плоскую структуру для DataFrame.
+    parse_numbers=False — числовые поля (INT_FIELDS, FLOAT_FIELDS) остаются как в JSON,
+    их разбирает build_leader_frame целыми колонками (normalize_numeric_values).
+    log_debug — выводить ли DEBUG-запись о лидере (None — проверить is_debug_logging_enabled()).
+    При загрузке файла флаг вычисляется один раз, а не для каждого лидера.
+    fields — множество полей лидера верхнего уровня, которые попадают в строку
+    (см. get_leader_projection); None — все поля. divisionRatings разворачивается всегда.
+    """
+    if log_debug is None:
+        log_debug = is_debug_logging_enabled()
+    # Контекст нужен только для сообщений об ошибках поштучного разбора чисел
+    context = None
+    if parse_numbers:
+        employee = leader.get('employeeNumber', 'N/A')
+        context = f"файл={source_file}, турнир={tournament_id}, employee={employee}"
     # Лог: запуск обработки лидера
-    logging.debug(LOG_MESSAGES["FLATTEN_LEADER_START"].format(
-        employee=employee, tournament_id=tournament_id, source_file=source_file
-    ))
+    if log_debug:
+        logging.debug(LOG_MESSAGES["FLATTEN_LEADER_START"].format(
+            employee=leader.get('employeeNumber', 'N/A'), tournament_id=tournament_id, source_file=source_file
+        ))
 
     row = {
         'SourceFile': source_file,
@@ -588,7 +889,9 @@ def flatten_leader(leader, tournament_id, source_file):
     for k, v in leader.items():
         if k in ("divisionRatings", "photoData"):
             continue
-        if k in FLOAT_FIELDS:
+        if fields is not None and k not in fields:
+            continue
+        if k in FLOAT_FIELDS and parse_numbers:
             row[k] = parse_float(v, context)
         else:
             row[k] = v
@@ -602,7 +905,9 @@ def flatten_leader(leader, tournament_id, source_file):
                 colname = f"divisionRatings_{group}_{field}"
                 if field in div:
                     value = div[field]
-                    if colname in INT_FIELDS:
+                    if not parse_numbers:
+                        row[colname] = value
+                    elif colname in INT_FIELDS:
                         row[colname] = parse_int(value, context)
                     elif colname in FLOAT_FIELDS:
                         row[colname] = parse_float(value, context)
@@ -617,66 +922,1274 @@ def flatten_leader(leader, tournament_id, source_file):
     return row
 
 
-def process_json_file(filepath):
-    """Загружает JSON-файл и превращает его в список словарей."""
+# --- Регулярные выражения для потокового разбора JSON (работают с байтами) ---
+_JSON_WS_RE = re.compile(rb'[ \t\r\n]*')
+# Шаблоны строк записаны в «развёрнутой» форме без вложенных квантификаторов,
+# чтобы незакрытая на границе блока строка не вызывала экспоненциального перебора
+_JSON_STRING_RE = re.compile(rb'"[^"\\]*(?:\\.[^"\\]*)*"', re.S)
+_JSON_STRING_BODY_RE = re.compile(rb'[^"\\]*(?:\\.[^"\\]*)*', re.S)
+_JSON_SCALAR_RE = re.compile(rb'[^,:}\]\s]+')
+# Имя поля (без экранирования) перед двоеточием в конце уже прочитанного текста
+_JSON_KEY_TAIL_RE = re.compile(rb'"([^"\\]*)"[ \t\r\n]*:[ \t\r\n]*\Z')
+# Поля на пути от записи турнира к списку лидеров: record.body.tournament.leaders
+_JSON_LEADERS_PATH = (b'body', b'tournament', b'leaders')
+# Начало турнира верхнего уровня: '{' или ',' перед ключом, значение — запись {"body": ...} или список записей
+_JSON_TOURNAMENT_START_RE = re.compile(
+    rb'[{,][ \t\r\n]*("[^"\\]*(?:\\.[^"\\]*)*")[ \t\r\n]*:[ \t\r\n]*(?:\[[ \t\r\n]*)?\{[ \t\r\n]*"body"[ \t\r\n]*:')
+# Сколько байт конца прочитанного блока просматривается ещё раз с началом следующего (_find_tournament_start)
+_JSON_TOURNAMENT_START_OVERLAP = 64 * 1024
+
+
+class JsonLoadError(ValueError):
+    """Выгрузку не удалось разобрать целиком; частичный результат не используется."""
+
+
+class JsonRangeError(ValueError):
+    """
+    Часть файла (byte_range) не сошлась с турнирами: разбор прошёл её конец, не попав на ключ турнира,
+    или объект верхнего уровня закончился раньше. Граница части найдена неверно — файл нужно
+    разобрать одной частью (см. process_json_files_parallel).
+    """
+
+
+class JsonDuplicateKeyError(ValueError):
+    """
+    Ключ турнира верхнего уровня встретился повторно. json.load оставляет последнее значение ключа
+    на месте первого, а поток уже отдал первое — файл нужно разобрать заново целиком.
+    """
+
+    def __init__(self, tournament_key):
+        super().__init__(f"ключ турнира {tournament_key!r} встречается повторно")
+        self.tournament_key = tournament_key
+
+    def __reduce__(self):
+        # Передаётся из процесса пула (process_json_files_parallel) с исходным ключом
+        return type(self), (self.tournament_key,)
+
+
+class JsonTournamentStream:
+    """
+    Потоковый разбор JSON-объекта верхнего уровня вида {tournament_key: records, ...}.
+
+    Файл читается блоками по chunk_size байт, наружу по одному отдаются пары
+    (tournament_key, raw_bytes), где raw_bytes — текст значения одного турнира.
+    Значения полей из skip_fields в объектах лидеров (records[i].body.tournament.leaders[j],
+    records — список записей или одна запись) заменяются на null прямо в байтовом потоке:
+    они не копируются в буфер турнира и не декодируются в строки Python. Поля с теми же
+    именами на других уровнях (например, внутри полей лидера) сохраняются.
+    Повторный ключ турнира вызывает JsonDuplicateKeyError (см. process_json_file);
+    unique_keys=False — повторы не проверяются (замер скорости разбора, benchmark_json_backends).
+    Атрибут block_offset — смещение ключа текущего турнира в файле
+    (по нему файл делится на части при параллельной загрузке).
+
+    start — смещение ключа турнира (см. _split_file_ranges), с которого начинается разбор: файл
+    переставляется на него без чтения предыдущих турниров; end — смещение, на ключе
+    которого разбор останавливается (None — до конца объекта). Если end не совпал с ключом
+    турнира, вызывается JsonRangeError: так проверяется граница, с которой начинается следующая часть.
+    """
+
+    def __init__(self, fileobj, chunk_size=None, skip_fields=None, start=0, end=None, unique_keys=True):
+        self._file = fileobj
+        self._chunk_size = chunk_size or JSON_STREAM_CHUNK_SIZE
+        fields = JSON_SKIP_FIELDS if skip_fields is None else skip_fields
+        self._skip_keys = {json.dumps(name).encode('utf-8') for name in fields}
+        # Строки с именами пропускаемых полей не поглощаются общим проходом,
+        # чтобы их можно было обработать отдельно
+        skip_alt = b'|'.join(re.escape(key[1:]) for key in self._skip_keys)
+        lookahead = b'(?!(?:' + skip_alt + b'))' if skip_alt else b''
+        self._run_re = re.compile(
+            rb'[^"{}\[\]]*(?:"' + lookahead + rb'[^"\\]*(?:\\.[^"\\]*)*"[^"{}\[\]]*)*', re.S
+        )
+        self._buf = b''
+        self._pos = 0
+        self._start = start
+        self._end = end
+        if start:
+            fileobj.seek(start)
+        # Смещение начала буфера от начала файла
+        self._base = start
+        self._eof = False
+        self.tournaments = 0
+        self.max_block_size = 0
+        # Ключи турниров в порядке появления (для проверки повторов между частями файла)
+        self.tournament_keys = []
+        self._seen_keys = set() if unique_keys else None
+        # Смещение ключа текущего турнира от начала файла (в байтах)
+        self.block_offset = 0
+
+    def _fill(self):
+        """Дочитывает очередной блок файла, отбрасывая уже обработанную часть буфера."""
+        if self._eof:
+            return False
+        chunk = self._file.read(self._chunk_size)
+        if not chunk:
+            self._eof = True
+            return False
+        self._buf = self._buf[self._pos:] + chunk
+        self._base += self._pos
+        self._pos = 0
+        return True
+
+    def _skip_ws(self):
+        while True:
+            self._pos = _JSON_WS_RE.match(self._buf, self._pos).end()
+            if self._pos < len(self._buf) or not self._fill():
+                return
+
+    def _next_char(self):
+        self._skip_ws()
+        if self._pos >= len(self._buf):
+            raise ValueError("Неожиданный конец файла")
+        return self._buf[self._pos:self._pos + 1]
+
+    def _expect(self, char):
+        found = self._next_char()
+        if found != char:
+            raise ValueError(f"Ожидался символ {char!r}, найден {found!r} (позиция в буфере {self._pos})")
+        self._pos += 1
+
+    def _read_scalar(self):
+        """Читает строку, число или литерал (true/false/null) целиком."""
+        is_string = self._next_char() == b'"'
+        regex = _JSON_STRING_RE if is_string else _JSON_SCALAR_RE
+        while True:
+            m = regex.match(self._buf, self._pos)
+            # Строка с закрывающей кавычкой завершена; число или литерал — только
+            # если за ним уже есть следующий символ либо файл закончился
+            if m and (is_string or m.end() < len(self._buf) or self._eof):
+                self._pos = m.end()
+                return m.group()
+            if not self._fill() and not m:
+                raise ValueError("Неожиданный конец файла внутри значения")
+
+    def _skip_value(self):
+        """Пропускает значение без накопления: строки — блоками, остальное — через разбор."""
+        if self._next_char() != b'"':
+            self._read_value()
+            return
+        self._pos += 1
+        while True:
+            self._pos = _JSON_STRING_BODY_RE.match(self._buf, self._pos).end()
+            if self._pos < len(self._buf) and self._buf[self._pos:self._pos + 1] == b'"':
+                self._pos += 1
+                return
+            if not self._fill():
+                raise ValueError("Неожиданный конец файла внутри строки")
+
+    @staticmethod
+    def _key_before(out):
+        """Имя поля, значение которого начинается в конце out, или None (элемент списка, экранированное имя)."""
+        tail = bytes(out[-256:])
+        m = _JSON_KEY_TAIL_RE.search(tail)
+        if m is None or m.start() == 0 or tail[m.start() - 1:m.start()] == b'\\':
+            return None
+        return m.group(1)
+
+    def _read_value(self):
+        """Возвращает байты одного JSON-значения с заменой пропускаемых полей лидеров на null."""
+        first = self._next_char()
+        if first not in (b'{', b'['):
+            return self._read_scalar()
+        out = bytearray()
+        depth = 0
+        # Глубина записи турнира (значение — список записей или одна запись) и объекта лидера;
+        # path_depth — до какой глубины открытые скобки лежат на пути record.body.tournament.leaders[j]
+        record_depth = 2 if first == b'[' else 1
+        leader_depth = record_depth + len(_JSON_LEADERS_PATH) + 1
+        path_depth = 0
+        while True:
+            buf = self._buf
+            end = self._run_re.match(buf, self._pos).end()
+            out += buf[self._pos:end]
+            self._pos = end
+            if end >= len(buf):
+                if not self._fill():
+                    raise ValueError("Неожиданный конец файла внутри турнира")
+                continue
+            char = buf[end:end + 1]
+            if char in (b'{', b'['):
+                depth += 1
+                if path_depth == depth - 1 < leader_depth and (
+                        not record_depth < depth < leader_depth
+                        or self._key_before(out) == _JSON_LEADERS_PATH[depth - record_depth - 1]):
+                    path_depth = depth
+                out += char
+                self._pos += 1
+                continue
+            if char in (b'}', b']'):
+                if path_depth == depth:
+                    path_depth -= 1
+                depth -= 1
+                out += char
+                self._pos += 1
+                if depth == 0:
+                    return out
+                continue
+            # Кавычка: либо имя пропускаемого поля, либо строка, не поместившаяся в буфер
+            m = _JSON_STRING_RE.match(buf, end)
+            after = _JSON_WS_RE.match(buf, m.end()).end() if m else len(buf)
+            if after >= len(buf):
+                if not self._fill():
+                    raise ValueError("Неожиданный конец файла внутри строки")
+                continue
+            if (buf[after:after + 1] == b':' and m.group() in self._skip_keys
+                    and depth == leader_depth == path_depth):
+                out += buf[end:after + 1] + b'null'
+                self._pos = after + 1
+                self._skip_value()
+            else:
+                out += buf[end:m.end()]
+                self._pos = m.end()
+
+    def _top_level(self, read_value):
+        """Пары (ключ, read_value()) объекта верхнего уровня в диапазоне [start, end)."""
+        if not self._start:
+            self._expect(b'{')
+            if self._next_char() == b'}':
+                self._pos += 1
+                return
+        while True:
+            self._skip_ws()
+            self.block_offset = self._base + self._pos
+            if self._end is not None and self.block_offset >= self._end:
+                if self.block_offset != self._end:
+                    raise JsonRangeError(f"конец части {self._end} не совпал с ключом турнира "
+                                         f"(ближайший ключ — {self.block_offset})")
+                return
+            tournament_key = json.loads(self._read_scalar())
+            if self._seen_keys is not None:
+                if tournament_key in self._seen_keys:
+                    raise JsonDuplicateKeyError(tournament_key)
+                self._seen_keys.add(tournament_key)
+            self.tournament_keys.append(tournament_key)
+            self._expect(b':')
+            yield tournament_key, read_value()
+            separator = self._next_char()
+            self._pos += 1
+            if separator == b'}':
+                if self._end is not None:
+                    raise JsonRangeError(f"объект верхнего уровня закончился до конца части {self._end}")
+                return
+            if separator != b',':
+                raise ValueError(f"Ожидался символ ',' или '}}', найден {separator!r}")
+
+    def __iter__(self):
+        for tournament_key, raw in self._top_level(self._read_value):
+            self.tournaments += 1
+            self.max_block_size = max(self.max_block_size, len(raw))
+            yield tournament_key, raw
+
+
+# Сигнатуры сжатых файлов и функции потокового открытия
+_COMPRESSION_MAGIC = ((b'\x1f\x8b', "gzip"), (b'BZh', "bz2"), (b'\xfd7zXZ\x00', "xz"))
+_COMPRESSION_OPENERS = {"gzip": gzip.open, "bz2": bz2.open, "xz": lzma.open}
+
+
+def detect_json_compression(filepath):
+    """Формат сжатия файла ('gzip', 'bz2', 'xz') по сигнатуре или расширению; None — обычный JSON."""
+    try:
+        with open(filepath, 'rb') as f:
+            head = f.read(6)
+    except OSError:
+        head = b''
+    for magic, compression in _COMPRESSION_MAGIC:
+        if head.startswith(magic):
+            return compression
+    return JSON_COMPRESSION_EXTENSIONS.get(os.path.splitext(filepath)[1].lower())
+
+
+def open_json_source(filepath):
+    """
+    Открывает выгрузку для чтения в бинарном режиме: сжатый файл распаковывается потоком
+    по мере чтения, несжатый при JSON_USE_MMAP отображается в память (mmap).
+    """
+    compression = detect_json_compression(filepath)
+    if compression:
+        return _COMPRESSION_OPENERS[compression](filepath, 'rb')
+    if JSON_USE_MMAP:
+        with open(filepath, 'rb') as f:
+            # Пустой файл отобразить нельзя — он читается обычным образом
+            if os.fstat(f.fileno()).st_size:
+                return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    return open(filepath, 'rb')
+
+
+def use_json_streaming(filepath):
+    """
+    Разбирать ли выгрузку потоком (JsonTournamentStream): при JSON_STREAMING — сжатые файлы
+    и файлы не меньше JSON_STREAMING_MIN_MB; остальные загружаются целиком через json.load (быстрее).
+    """
+    if not JSON_STREAMING:
+        return False
+    if detect_json_compression(filepath):
+        return True
+    try:
+        return os.path.getsize(filepath) >= JSON_STREAMING_MIN_MB * 2 ** 20
+    except OSError:
+        return True
+
+
+def available_json_backends():
+    """Установленные парсеры JSON в порядке предпочтения: {имя: loads}."""
+    backends = {}
+    if orjson is not None:
+        backends["orjson"] = orjson.loads
+    if simdjson is not None:
+        backends["simdjson"] = simdjson.loads
+    backends["json"] = json.loads
+    return backends
+
+
+def get_json_backend():
+    """Парсер JSON по параметру JSON_BACKEND: (имя, loads). Недоступный парсер заменяется стандартным json."""
+    backends = available_json_backends()
+    if JSON_BACKEND == "auto":
+        name = next(iter(backends))
+    else:
+        name = JSON_BACKEND if JSON_BACKEND in backends else "json"
+    return name, backends[name]
+
+
+def log_json_backend():
+    """Пишет в лог выбранный парсер JSON (и предупреждение, если заданный недоступен)."""
+    name, _ = get_json_backend()
+    if JSON_BACKEND not in ("auto", name):
+        logging.warning(LOG_MESSAGES["JSON_BACKEND_UNAVAILABLE"].format(requested=JSON_BACKEND, backend=name))
+    logging.info(LOG_MESSAGES["JSON_BACKEND_SELECTED"].format(
+        backend=name, requested=JSON_BACKEND, available=list(available_json_backends()), use_mmap=JSON_USE_MMAP))
+
+
+def _json_decode_errors(loads):
+    """
+    Исключения, которыми быстрый парсер сообщает, что не принял данные (NaN, целые больше 64 бит,
+    неподдерживаемый буфер): такие данные разбираются стандартным json. Прочие ошибки не перехватываются.
+    """
+    if orjson is not None and loads is orjson.loads:
+        return orjson.JSONDecodeError
+    if simdjson is not None and loads is simdjson.loads:
+        return ValueError, TypeError
+    return ()
+
+
+# Парсеры, о переходе которых на стандартный json уже написано в лог
+_JSON_FALLBACK_LOGGED = set()
+
+
+def decode_json(data, loads=None):
+    """
+    Разбирает JSON из байтов (или буфера mmap) выбранным парсером без промежуточной копии байтов.
+    Если быстрый парсер не принял данные, они разбираются стандартным json — результат и ошибки как у json.loads;
+    переход пишется в лог один раз на парсер.
+    """
+    if loads is None:
+        loads = get_json_backend()[1]
+    if loads is not json.loads:
+        try:
+            if isinstance(data, mmap.mmap):
+                with memoryview(data) as view:
+                    return loads(view)
+            return loads(data)
+        except _json_decode_errors(loads) as ex:
+            name = next((name for name, backend in available_json_backends().items() if backend is loads), repr(loads))
+            if name not in _JSON_FALLBACK_LOGGED:
+                _JSON_FALLBACK_LOGGED.add(name)
+                logging.warning(LOG_MESSAGES["JSON_BACKEND_FALLBACK"].format(backend=name, ex=ex))
+    if isinstance(data, mmap.mmap):
+        # json.loads не принимает mmap: текст декодируется прямо из буфера, как json.loads декодирует байты
+        with memoryview(data) as view:
+            return json.loads(str(view, json.detect_encoding(data[:4]), 'surrogatepass'))
+    return json.loads(data)
+
+
+def benchmark_json_backends(filepath, repeats=None):
+    """
+    Замер скорости разбора выгрузки каждым доступным парсером.
+    Разбираются блоки турниров из JsonTournamentStream — в том виде, в каком их получает загрузчик.
+    Файл читается один раз: каждый блок разбирается всеми парсерами (repeats раз, берётся лучшее время)
+    и сразу отбрасывается, поэтому в памяти одновременно только один блок. Повторные ключи турниров
+    не проверяются — на скорость разбора они не влияют.
+
+    Returns:
+        {имя парсера: MB/s}
+    """
+    if repeats is None:
+        repeats = JSON_BACKEND_BENCHMARK_REPEATS
+    filename = os.path.basename(filepath)
+    backends = available_json_backends()
+    seconds = dict.fromkeys(backends, 0.0)
+    total_bytes = 0
+    with open_json_source(filepath) as f:
+        for _, raw in JsonTournamentStream(f, unique_keys=False):
+            total_bytes += len(raw)
+            for name, loads in backends.items():
+                best = None
+                for _ in range(max(repeats, 1)):
+                    t_beg = time.perf_counter()
+                    decode_json(raw, loads)
+                    elapsed = time.perf_counter() - t_beg
+                    best = elapsed if best is None else min(best, elapsed)
+                seconds[name] += best
+    total_mb = total_bytes / 2 ** 20
+    results = {}
+    for name, best in seconds.items():
+        results[name] = total_mb / best if best else float('inf')
+        logging.info(LOG_MESSAGES["JSON_BACKEND_BENCHMARK"].format(
+            filename=filename, backend=name, mb=total_mb, seconds=best, mb_per_s=results[name]))
+    return results
+
+
+def get_leader_projection():
+    """
+    Поля лидера верхнего уровня, нужные отчёту, при RAW_SHEETS_MODE 'slim' или 'skip':
+    PRIORITY_COLS, COMPARE_KEYS, COMPARE_FIELDS, FLOAT_FIELDS (divisionRatings_* разворачиваются всегда).
+    В режиме 'full' возвращает None — в строку попадают все поля.
+    """
+    if get_raw_sheets_mode() == "full":
+        return None
+    columns = set(PRIORITY_COLS) | set(COMPARE_KEYS) | set(COMPARE_FIELDS) | set(FLOAT_FIELDS)
+    return frozenset(c for c in columns if not c.startswith('divisionRatings_'))
+
+
+def get_tournament_filter():
+    """
+    Список турниров для фильтрации при разборе (frozenset) или None, если BEFORE/AFTER грузятся целиком
+    (FILTER_TOURNAMENTS_IN_BEFORE_AFTER выключен или ALLOWED_TOURNAMENT_IDS пустой).
+    """
+    if not FILTER_TOURNAMENTS_IN_BEFORE_AFTER or not ALLOWED_TOURNAMENT_IDS:
+        return None
+    return frozenset(ALLOWED_TOURNAMENT_IDS)
+
+
+def _is_allowed_tournament(tournament_id, allowed_ids):
+    """Проверка турнира по списку (как df['tournamentId'].isin(allowed_ids))."""
+    try:
+        return tournament_id in allowed_ids
+    except TypeError:
+        return False
+
+
+def get_raw_sheets_mode():
+    """Проверенное значение RAW_SHEETS_MODE (неизвестное значение считается 'full')."""
+    if RAW_SHEETS_MODE in RAW_SHEETS_MODES:
+        return RAW_SHEETS_MODE
+    logging.warning(LOG_MESSAGES["RAW_SHEETS_MODE_UNKNOWN"].format(mode=RAW_SHEETS_MODE, modes=RAW_SHEETS_MODES))
+    return "full"
+
+
+def iter_tournament_rows(tournament_key, records, filename, parse_numbers=True, log_debug=None, fields=None,
+                         allowed_ids=None, skipped=None, failed=None):
+    """
+    Разворачивает записи одного турнира верхнего уровня в строки лидеров (генератор).
+    parse_numbers, log_debug, fields — см. flatten_leader.
+    allowed_ids: турниры, которые разворачиваются (None — все); записи остальных турниров
+                 пропускаются целиком, число их строк добавляется в skipped {tournamentId: строк}.
+    failed: список, в который добавляется tournament_key, если запись или лидер пропущены из-за ошибки.
+    """
+    if log_debug is None:
+        log_debug = is_debug_logging_enabled()
+    entries = []
+    if isinstance(records, list):
+        entries = records
+    elif isinstance(records, dict):
+        entries = [records]
+    else:
+        logging.warning(LOG_MESSAGES["PROCESS_JSON_BAD_RECORD"].format(
+            tournament_key=tournament_key, record=repr(records)[:100]))
+        if failed is not None:
+            failed.append(tournament_key)
+        return
+    for record in entries:
+        try:
+            if not isinstance(record, dict):
+                logging.warning(LOG_MESSAGES["PROCESS_JSON_BAD_RECORD"].format(
+                    tournament_key=tournament_key, record=repr(record)[:100]))
+                if failed is not None:
+                    failed.append(tournament_key)
+                continue
+            tournament = record.get("body", {}).get("tournament", {})
+            tournament_id = tournament.get("tournamentId", tournament_key)
+            leaders = tournament.get("leaders", [])
+            if isinstance(leaders, dict):
+                leaders = list(leaders.values())
+            elif not isinstance(leaders, list):
+                leaders = []
+            if allowed_ids is not None and not _is_allowed_tournament(tournament_id, allowed_ids):
+                # Лидеры турнира вне списка не разворачиваются; пустой турнир дал бы одну строку-заглушку
+                if skipped is not None:
+                    key = str(tournament_id)
+                    skipped[key] = skipped.get(key, 0) + (len(leaders) or 1)
+                continue
+            if not leaders:
+                stub = {
+                    'SourceFile': filename,
+                    'tournamentId': tournament_id,
+                    'employeeNumber': '00000000',
+                    'lastName': 'None',
+                    'firstName': 'None'
+                }
+                for field in FLOAT_FIELDS + INT_FIELDS:
+                    stub[field] = None
+                yield stub
+                logging.info(LOG_MESSAGES["PROCESS_JSON_EMPTY_LEADERS"].format(
+                    tournament_id=tournament_id, filename=filename))
+                continue
+            for leader in leaders:
+                try:
+                    row = flatten_leader(leader, tournament_id, filename, parse_numbers, log_debug, fields)
+                except Exception as ex:
+                    logging.error(LOG_MESSAGES["PROCESS_JSON_FLATTEN_LEADER_ERROR"].format(
+                        filename=filename, tournament_id=tournament_id,
+                        employee=leader.get('employeeNumber', 'N/A'), ex=ex))
+                    if failed is not None:
+                        failed.append(tournament_key)
+                    continue
+                yield row
+        except Exception as ex:
+            logging.error(LOG_MESSAGES["PROCESS_JSON_RECORD_ERROR"].format(
+                filename=filename, tournament_key=tournament_key, ex=ex))
+            if failed is not None:
+                failed.append(tournament_key)
+
+
+def iter_json_file_rows(filepath, streaming=None, byte_range=None, parse_numbers=True, fields=None,
+                        allowed_ids=None, skipped=None, failed=None, keys=None):
+    """
+    Генератор плоских строк лидеров из JSON-файла.
+
+    Args:
+        filepath: путь к JSON-файлу
+        streaming: True — потоковый разбор по одному турниру (JsonTournamentStream),
+                   False — загрузка файла целиком через json.load;
+                   None — по параметрам JSON_STREAMING и JSON_STREAMING_MIN_MB (use_json_streaming)
+        byte_range: (start, end) — разбирать только турниры, ключ которых начинается
+                    в этом диапазоне байт файла (end=None — до конца файла). start — 0 или
+                    смещение ключа турнира (см. _split_file_ranges): разбор начинается сразу с него,
+                    предыдущие турниры не читаются. Работает только в потоковом режиме.
+        parse_numbers: False — числовые поля не разбираются по одному значению
+                       (их разбирает build_leader_frame целыми колонками)
+        fields: поля лидера, которые попадают в строки (None — все), см. get_leader_projection
+        allowed_ids: турниры, лидеры которых разворачиваются (None — все), см. get_tournament_filter
+        skipped: словарь {tournamentId: строк}, куда считаются строки пропущенных турниров
+        failed: список ключей турниров, записи или лидеры которых пропущены из-за ошибки (см. iter_tournament_rows)
+        keys: список, куда добавляются ключи турниров верхнего уровня (только в потоковом режиме)
+
+    Ошибка разбора файла логируется и пробрасывается как JsonLoadError: выгрузка, прочитанная
+    не до конца, не должна попасть в отчёт (турниры после места ошибки выглядели бы удалёнными).
+    Повторный ключ турнира при потоковом разборе пробрасывается как JsonDuplicateKeyError без записи
+    в лог: файл разбирается заново через json.load (см. process_json_file). Несовпадение конца byte_range
+    с ключом турнира пробрасывается как JsonRangeError, тоже без записи в лог.
+    Ошибки отдельных записей и лидеров только логируются, как и раньше.
+    """
     filename = os.path.basename(filepath)
-    rows = []
+    if streaming is None:
+        streaming = byte_range is not None or use_json_streaming(filepath)
+    # Уровень логирования и парсер JSON выбираются один раз на загрузку, а не для каждого лидера
+    log_debug = is_debug_logging_enabled()
+    loads = get_json_backend()[1]
+    if not streaming:
+        try:
+            with open_json_source(filepath) as f:
+                js = decode_json(f if isinstance(f, mmap.mmap) else f.read(), loads)
+        except Exception as ex:
+            message = LOG_MESSAGES["PROCESS_JSON_LOAD_ERROR"].format(filepath=filepath, ex=ex)
+            logging.error(message)
+            raise JsonLoadError(message) from ex
+        # Перебор турниров
+        for tournament_key, records in js.items():
+            yield from iter_tournament_rows(tournament_key, records, filename, parse_numbers, log_debug, fields,
+                                            allowed_ids, skipped, failed)
+        return
+
+    start, end = byte_range or (0, None)
+    rows = 0
+    tournaments = 0
+    max_block_size = 0
     try:
-        with open(filepath, 'r', encoding='utf-8') as f:
-            js = json.load(f)
+        with open_json_source(filepath) as f:
+            stream = JsonTournamentStream(f, start=start, end=end)
+            for tournament_key, raw in stream:
+                tournaments += 1
+                max_block_size = max(max_block_size, len(raw))
+                records = decode_json(raw, loads)
+                del raw
+                for row in iter_tournament_rows(tournament_key, records, filename, parse_numbers, log_debug, fields,
+                                                allowed_ids, skipped, failed):
+                    rows += 1
+                    yield row
+            if keys is not None:
+                keys.extend(stream.tournament_keys)
+    except (JsonDuplicateKeyError, JsonRangeError):
+        raise
     except Exception as ex:
-        logging.error(LOG_MESSAGES["PROCESS_JSON_LOAD_ERROR"].format(filepath=filepath, ex=ex))
-        return []
-    # Перебор турниров
-    for tournament_key, records in js.items():
-        entries = []
-        if isinstance(records, list):
-            entries = records
-        elif isinstance(records, dict):
-            entries = [records]
+        if tournaments == 0:
+            message = LOG_MESSAGES["PROCESS_JSON_LOAD_ERROR"].format(filepath=filepath, ex=ex)
         else:
-            logging.warning(LOG_MESSAGES["PROCESS_JSON_BAD_RECORD"].format(
-                tournament_key=tournament_key, record=repr(records)[:100]))
+            message = LOG_MESSAGES["PROCESS_JSON_STREAM_ERROR"].format(
+                filepath=filepath, tournaments=tournaments, rows=rows, ex=ex)
+        logging.error(message)
+        raise JsonLoadError(message) from ex
+    logging.info(LOG_MESSAGES["PROCESS_JSON_STREAM_DONE"].format(
+        filename=filename, tournaments=tournaments, rows=rows,
+        max_block_kb=max_block_size / 1024))
+
+
+def _text_column_dtype():
+    """Тип текстовых колонок, который pandas вывел бы сам (str в pandas 3, object ранее)."""
+    try:
+        return "str" if pd.get_option("future.infer_string") else object
+    except Exception:
+        return object
+
+
+def _is_schema_column(name):
+    """Колонка схемы загрузки: числовые поля, PRIORITY_COLS и divisionRatings_*."""
+    return (name in INT_FIELDS or name in FLOAT_FIELDS or name in PRIORITY_COLS
+            or name.startswith('divisionRatings_'))
+
+
+def build_leader_frame(rows):
+    """
+    Собирает DataFrame из плоских строк лидеров (pd.DataFrame(rows): отсутствующий ключ — NaN,
+    явный None — None, порядок колонок — по первому появлению).
+    Числовые поля (INT_FIELDS, FLOAT_FIELDS), оставленные flatten_leader как в JSON (parse_numbers=False),
+    разбираются целыми колонками (normalize_numeric_values): значения и типы колонок те же,
+    что при разборе parse_int/parse_float в каждой строке.
+
+    Returns:
+        (df, failures): failures — {поле: (номера строк, исходные значения)} для значений,
+        которые не удалось преобразовать в число
+    """
+    if not rows:
+        return pd.DataFrame(), {}
+    df = pd.DataFrame(rows)
+    failures = {}
+    numeric = [name for name in df.columns if name in INT_FIELDS or name in FLOAT_FIELDS]
+    if not numeric:
+        return df, failures
+    # Исходные значения числовых полей без вывода типов (отсутствующий ключ — NaN)
+    raw = pd.DataFrame(rows, columns=numeric, dtype=object)
+    for name in numeric:
+        values = raw[name].to_numpy()
+        # Отсутствующий ключ остаётся NaN и не разбирается (flatten_leader задаёт числовые поля всегда)
+        present = None
+        nulls = np.flatnonzero(pd.isna(values))
+        nans = nulls[np.not_equal(values[nulls], None)].tolist() if len(nulls) else []
+        missing = [i for i in nans if name not in rows[i]]
+        if missing:
+            present = np.flatnonzero(~np.isin(np.arange(len(values)), missing))
+        parsed, failed = normalize_numeric_values(values if present is None else values[present],
+                                                  as_int=name in INT_FIELDS)
+        if present is not None:
+            column = np.full(len(values), np.nan, dtype=object)
+            column[present] = parsed
+            parsed = column.tolist()
+        bad = np.flatnonzero(failed)
+        if len(bad):
+            positions = bad if present is None else present[bad]
+            failures[name] = (positions, values[positions].tolist())
+        df[name] = pd.Series(parsed, index=df.index)
+    return df, failures
+
+
+class ParseDiagnostics:
+    """
+    Сводка аномалий разбора за одну загрузку: счётчики по полю и турниру
+    и ограниченная выборка исходных значений (PARSE_DIAG_MAX_SAMPLES на пару поле/турнир).
+    В лог выводится одной записью в конце загрузки (log_summary).
+    """
+
+    def __init__(self, max_samples=None):
+        self.max_samples = PARSE_DIAG_MAX_SAMPLES if max_samples is None else max_samples
+        self.counters = {}
+        self.samples = {}
+        # Ключи турниров, записи или лидеры которых пропущены из-за ошибок (см. iter_tournament_rows)
+        self.failed = []
+
+    def add(self, field, tournament_id, value=None, sample=True):
+        """Учитывает одно нераспознанное значение; sample=False — только в счётчике, без примера."""
+        key = (field, tournament_id)
+        self.counters[key] = self.counters.get(key, 0) + 1
+        samples = self.samples.setdefault(key, [])
+        if sample and len(samples) < self.max_samples:
+            text = repr(value)[:PARSE_DIAG_SAMPLE_LENGTH]
+            if text not in samples:
+                samples.append(text)
+
+    def add_failures(self, failures, tournament_ids):
+        """
+        Переносит ошибки разбора чисел из build_leader_frame ({поле: (номера строк, значения)});
+        tournament_ids — значения tournamentId по строкам (None — без разбивки по турнирам).
+        """
+        for field, (rows, values) in failures.items():
+            tids = np.asarray(tournament_ids, dtype=object)[rows] if tournament_ids is not None else [None] * len(rows)
+            for value, tid in zip(values, tids):
+                self.add(field, tid, value)
+
+    @property
+    def total(self):
+        return sum(self.counters.values())
+
+    def summary(self):
+        """{поле: {турнир: {'count': число, 'samples': [примеры]}}}"""
+        result = {}
+        for (field, tid), count in self.counters.items():
+            result.setdefault(field, {})[str(tid)] = {'count': count, 'samples': self.samples[(field, tid)]}
+        return result
+
+    def to_state(self):
+        """Состояние для JSON-заголовка снимка кэша (см. from_state)."""
+        return {
+            'counters': [[field, tid, count, self.samples[(field, tid)]]
+                         for (field, tid), count in self.counters.items()],
+            'failed': self.failed,
+        }
+
+    @classmethod
+    def from_state(cls, state):
+        """Восстанавливает сводку из снимка кэша (to_state)."""
+        diagnostics = cls()
+        for field, tid, count, samples in state['counters']:
+            diagnostics.counters[(field, tid)] = count
+            diagnostics.samples[(field, tid)] = samples
+        diagnostics.failed = list(state['failed'])
+        return diagnostics
+
+    def log_summary(self, filename):
+        if not self.counters:
+            return
+        summary = self.summary()
+        logging.error(LOG_MESSAGES["PARSE_DIAG_SUMMARY"].format(
+            filename=filename, total=self.total, fields=len(summary),
+            tournaments=len({tid for _, tid in self.counters}),
+            summary=json.dumps(summary, ensure_ascii=False)))
+
+
+def _finish_json_frame(filepath, rows, skipped=None, failed=None, diagnostics=None):
+    """
+    Собирает DataFrame из плоских строк лидеров (build_leader_frame) и логирует итог загрузки файла.
+    skipped — строки турниров, пропущенных при разборе ({tournamentId: строк}, None — фильтра не было);
+    их число сохраняется в df.attrs['rows_before_filter'] для лога filter_dataframe_by_tournaments.
+    failed — ключи турниров с ошибками записей (см. iter_tournament_rows). Если при разборе были ошибки
+    (вместе с нераспознанными числами), их число сохраняется в df.attrs['load_errors'].
+    diagnostics — ParseDiagnostics, в которую собираются ошибки (для снимка кэша); None — новая.
+    """
+    filename = os.path.basename(filepath)
+    df, failures = build_leader_frame(rows)
+    if skipped is not None:
+        skipped_rows = sum(skipped.values())
+        df.attrs['rows_before_filter'] = len(df) + skipped_rows
+        logging.info(LOG_MESSAGES["PROCESS_JSON_FILTER_SKIPPED"].format(
+            filename=filename, tournaments=len(skipped), rows=skipped_rows))
+    # Ошибки разбора чисел — одной структурированной записью на загрузку
+    if diagnostics is None:
+        diagnostics = ParseDiagnostics()
+    diagnostics.add_failures(failures, df['tournamentId'].to_numpy() if 'tournamentId' in df.columns else None)
+    diagnostics.failed.extend(failed or ())
+    diagnostics.log_summary(filename)
+    errors = len(diagnostics.failed) + diagnostics.total
+    if errors:
+        df.attrs['load_errors'] = errors
+    logging.info(LOG_MESSAGES["PROCESS_JSON_FRAME_DONE"].format(
+        filename=filename, n_rows=df.shape[0], n_cols=df.shape[1],
+        overflow=[name for name in df.columns if not _is_schema_column(name)]))
+    return df
+
+
+def _log_json_source(filepath, seconds):
+    """Пишет в лог формат выгрузки (сжатый или обычный JSON), размер на диске и время загрузки."""
+    try:
+        disk_mb = os.path.getsize(filepath) / 2 ** 20
+    except OSError:
+        disk_mb = 0.0
+    logging.info(LOG_MESSAGES["PROCESS_JSON_SOURCE_DONE"].format(
+        filename=os.path.basename(filepath), compression=detect_json_compression(filepath) or "json",
+        disk_mb=disk_mb, seconds=seconds))
+
+
+def process_json_file(filepath, allowed_ids=None, streaming=None, diagnostics=None):
+    """
+    Загружает JSON-файл (в том числе сжатый, см. open_json_source) и собирает DataFrame (build_leader_frame).
+    allowed_ids — турниры, которые разворачиваются (None — все); остальные пропускаются при разборе.
+    streaming — см. iter_json_file_rows. Если при потоковом разборе ключ турнира встретился повторно,
+    файл разбирается заново через json.load, чтобы, как и там, осталось последнее значение ключа.
+    diagnostics — ParseDiagnostics для ошибок разбора (см. _finish_json_frame).
+    """
+    t_beg = datetime.now()
+    while True:
+        skipped = {} if allowed_ids is not None else None
+        failed = []
+        try:
+            rows = list(iter_json_file_rows(filepath, streaming, parse_numbers=False, fields=get_leader_projection(),
+                                            allowed_ids=allowed_ids, skipped=skipped, failed=failed))
+            break
+        except JsonDuplicateKeyError as ex:
+            logging.warning(LOG_MESSAGES["PROCESS_JSON_DUPLICATE_KEY"].format(
+                filename=os.path.basename(filepath), tournament_key=ex.tournament_key))
+            streaming = False
+    df = _finish_json_frame(filepath, rows, skipped, failed, diagnostics)
+    _log_json_source(filepath, (datetime.now() - t_beg).total_seconds())
+    return df
+
+
+class _LogRecordCollector(logging.Handler):
+    """Собирает записи лога процесса пула, чтобы родитель вывел их в исходном порядке."""
+
+    def __init__(self):
+        super().__init__()
+        self.records = []
+
+    def emit(self, record):
+        # Сообщение форматируется сразу, чтобы запись гарантированно передавалась между процессами
+        record.msg = record.getMessage()
+        record.args = None
+        record.exc_info = None
+        record.exc_text = None
+        self.records.append(record)
+
+
+def _load_json_shard(filepath, byte_range, log_level, allowed_ids=None):
+    """
+    Задача процесса пула: разбирает часть файла в плоские строки лидеров.
+    Возвращает (строки, пропущенные строки {tournamentId: строк} или None, ключи турниров с ошибками,
+    ключи турниров части, записи лога, время в секундах, pid).
+    """
+    t_beg = datetime.now()
+    root = logging.getLogger()
+    saved_handlers, saved_level = root.handlers[:], root.level
+    collector = _LogRecordCollector()
+    root.handlers = [collector]
+    root.setLevel(log_level)
+    skipped = {} if allowed_ids is not None else None
+    failed, keys = [], []
+    try:
+        rows = list(iter_json_file_rows(filepath, byte_range=byte_range, parse_numbers=False,
+                                        fields=get_leader_projection(), allowed_ids=allowed_ids, skipped=skipped,
+                                        failed=failed, keys=keys))
+    finally:
+        root.handlers = saved_handlers
+        root.setLevel(saved_level)
+    return (rows, skipped, failed, keys, collector.records, (datetime.now() - t_beg).total_seconds(),
+            os.getpid())
+
+
+def _find_tournament_start(fileobj, position, limit, chunk_size=None):
+    """
+    Смещение первого ключа турнира верхнего уровня, начало которого (разделитель перед ключом)
+    лежит в [position, limit), или None. Файл переставляется на position и читается вперёд блоками
+    только до limit; ключ узнаётся по шаблону _JSON_TOURNAMENT_START_RE без разбора предыдущих турниров.
+    Шаблон может совпасть и внутри значения — такую границу отвергает разбор частей (JsonRangeError).
+    """
+    chunk_size = chunk_size or JSON_STREAM_CHUNK_SIZE
+    fileobj.seek(position)
+    base = position
+    buf = b''
+    while base + len(buf) < limit:
+        chunk = fileobj.read(chunk_size)
+        if not chunk:
+            return None
+        buf += chunk
+        m = _JSON_TOURNAMENT_START_RE.search(buf)
+        if m:
+            return base + m.start(1) if base + m.start() < limit else None
+        # Конец блока просматривается ещё раз вместе со следующим: шаблон мог попасть на стык
+        keep = min(len(buf), _JSON_TOURNAMENT_START_OVERLAP)
+        base += len(buf) - keep
+        buf = buf[len(buf) - keep:]
+    return None
+
+
+def _split_file_ranges(filepath, shards):
+    """
+    Делит файл на shards непрерывных диапазонов байт. Для каждой границы файл переставляется
+    на долю размера и просматривается вперёд до ближайшего ключа турнира (_find_tournament_start),
+    поэтому каждая часть начинает разбор сразу со своего турнира, а файл целиком заранее не читается.
+    Граница проверяется при разборе: предыдущая часть должна остановиться точно на ней, иначе
+    JsonRangeError и файл разбирается одной частью (process_json_files_parallel).
+    Сжатый файл не делится: размер распакованного текста заранее неизвестен; файл, который
+    не удалось просмотреть, разбирается одной частью (ошибку покажет сам разбор).
+    """
+    if shards <= 1 or not use_json_streaming(filepath) or detect_json_compression(filepath):
+        return [None]
+    bounds = [0]
+    try:
+        size = os.path.getsize(filepath)
+        with open_json_source(filepath) as f:
+            for i in range(1, shards):
+                offset = _find_tournament_start(f, max(size * i // shards, bounds[-1] + 1),
+                                                size * (i + 1) // shards)
+                if offset is not None:
+                    bounds.append(offset)
+    except (OSError, ValueError):
+        return [None]
+    bounds.append(None)
+    return [(bounds[i], bounds[i + 1]) for i in range(len(bounds) - 1)]
+
+
+def _duplicate_tournament_key(results):
+    """
+    Повторный ключ турнира в частях файла (результаты _load_json_shard или JsonDuplicateKeyError
+    части, где повтор найден при разборе) или None.
+    """
+    seen = set()
+    for result in results:
+        if isinstance(result, JsonDuplicateKeyError):
+            return result.tournament_key
+        for key in result[3]:
+            if key in seen:
+                return key
+            seen.add(key)
+    return None
+
+
+def process_json_files_parallel(filepaths, allowed_ids=None):
+    """
+    Загружает несколько JSON-файлов одновременно в пуле процессов.
+    allowed_ids — турниры, которые разворачиваются (None — все), как в process_json_file.
+
+    Файлы, снимки которых есть в кэше (SNAPSHOT_CACHE_ENABLED), в пул не отправляются.
+    Каждый файл при PARALLEL_LOAD_FILE_SHARDS > 1 делится на непрерывные части по турнирам.
+    Строки частей склеиваются в исходном порядке и собираются в DataFrame один раз, записи лога
+    процессов выводятся в том же порядке, что и при последовательной загрузке,
+    поэтому результат не зависит от порядка завершения задач.
+    Файл, в котором ключ турнира повторяется (в одной части или в разных), разбирается
+    заново целиком через json.load, как в process_json_file. Если часть файла не сошлась
+    с границей турнира (JsonRangeError) или не разобралась, файл разбирается заново одной частью:
+    настоящая ошибка разбора при этом выводится в лог и пробрасывается как JsonLoadError.
+
+    Returns:
+        (frames, seconds): словари {filepath: DataFrame} и {filepath: время загрузки в секундах}
+    """
+    frames, seconds, cache_paths = {}, {}, {}
+    for path in filepaths:
+        t_file = datetime.now()
+        df, cache_paths[path] = read_json_snapshot(path, allowed_ids)
+        if df is not None:
+            frames[path] = df
+            seconds[path] = (datetime.now() - t_file).total_seconds()
+    pending = [path for path in filepaths if path not in frames]
+    if not pending:
+        return frames, seconds
+
+    tasks = [(path, byte_range) for path in pending
+             for byte_range in _split_file_ranges(path, PARALLEL_LOAD_FILE_SHARDS)]
+    workers = min(PARALLEL_LOAD_WORKERS or os.cpu_count() or 1, len(tasks))
+    root = logging.getLogger()
+    # Процессам достаточно записей того уровня, который реально попадёт в обработчики
+    log_level = max(root.level, min((h.level for h in root.handlers), default=root.level))
+    logging.info(LOG_MESSAGES["PARALLEL_LOAD_START"].format(
+        files=[os.path.basename(p) for p in pending], tasks=len(tasks), workers=workers))
+
+    t_beg = datetime.now()
+    try:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            futures = [pool.submit(_load_json_shard, path, byte_range, log_level, allowed_ids) for path, byte_range in tasks]
+            results = []
+            for future in futures:
+                try:
+                    results.append(future.result())
+                except (JsonDuplicateKeyError, JsonRangeError, JsonLoadError) as ex:
+                    results.append(ex)
+    except Exception as ex:
+        logging.warning(LOG_MESSAGES["PARALLEL_LOAD_FALLBACK"].format(ex=ex))
+        for path in pending:
+            t_file = datetime.now()
+            diagnostics = ParseDiagnostics()
+            frames[path] = process_json_file(path, allowed_ids, diagnostics=diagnostics)
+            write_json_snapshot(cache_paths[path], frames[path], path, diagnostics)
+            seconds[path] = (datetime.now() - t_file).total_seconds()
+        return frames, seconds
+    t_wait = (datetime.now() - t_beg).total_seconds()
+
+    for path in pending:
+        filename = os.path.basename(path)
+        parts = [(byte_range, result) for (task_path, byte_range), result in zip(tasks, results) if task_path == path]
+        t_merge = datetime.now()
+        broken = next((result for _, result in parts if isinstance(result, (JsonRangeError, JsonLoadError))), None)
+        if isinstance(broken, JsonLoadError) and len(parts) == 1:
+            # Записи лога процесса с ошибкой потеряны вместе с ним — сообщение выводится ещё раз
+            logging.error(str(broken))
+            raise broken
+        if broken is not None:
+            logging.warning(LOG_MESSAGES["PARALLEL_LOAD_SPLIT_FALLBACK"].format(filename=filename, ex=broken))
+            diagnostics = ParseDiagnostics()
+            frames[path] = process_json_file(path, allowed_ids, diagnostics=diagnostics)
+            write_json_snapshot(cache_paths[path], frames[path], path, diagnostics)
+            seconds[path] = t_wait + (datetime.now() - t_merge).total_seconds()
+            continue
+        duplicate = _duplicate_tournament_key(result for _, result in parts)
+        if duplicate is not None:
+            logging.warning(LOG_MESSAGES["PROCESS_JSON_DUPLICATE_KEY"].format(
+                filename=filename, tournament_key=duplicate))
+            diagnostics = ParseDiagnostics()
+            frames[path] = process_json_file(path, allowed_ids, streaming=False, diagnostics=diagnostics)
+            write_json_snapshot(cache_paths[path], frames[path], path, diagnostics)
+            seconds[path] = t_wait + (datetime.now() - t_merge).total_seconds()
             continue
-        for record in entries:
+        rows = []
+        skipped = {} if allowed_ids is not None else None
+        failed = []
+        for shard, (_, (part, part_skipped, part_failed, _, records, part_seconds, pid)) in enumerate(parts, 1):
+            for record in records:
+                root.handle(record)
+            logging.info(LOG_MESSAGES["PARALLEL_LOAD_WORKER_DONE"].format(
+                filename=filename, shard=shard, shards=len(parts), rows=len(part),
+                seconds=part_seconds, pid=pid))
+            rows.extend(part)
+            for tid, count in (part_skipped or {}).items():
+                skipped[tid] = skipped.get(tid, 0) + count
+            failed.extend(part_failed)
+        diagnostics = ParseDiagnostics()
+        frames[path] = _finish_json_frame(path, rows, skipped, failed, diagnostics)
+        write_json_snapshot(cache_paths[path], frames[path], path, diagnostics)
+        merge_seconds = (datetime.now() - t_merge).total_seconds()
+        seconds[path] = t_wait + merge_seconds
+        logging.info(LOG_MESSAGES["PARALLEL_LOAD_FILE_DONE"].format(
+            filename=filename, seconds=seconds[path], merge_seconds=merge_seconds))
+        _log_json_source(path, seconds[path])
+    return frames, seconds
+
+
+def _snapshot_signature(allowed_ids=None):
+    """Подпись параметров, от которых зависит результат разбора: при их изменении снимки не подходят."""
+    options = {
+        'version': SNAPSHOT_PARSER_VERSION,
+        'pandas': pd.__version__,
+        'text_dtype': str(_text_column_dtype()),
+        'int_fields': INT_FIELDS,
+        'float_fields': FLOAT_FIELDS,
+        'priority_cols': PRIORITY_COLS,
+        'skip_fields': JSON_SKIP_FIELDS,
+        'projection': sorted(get_leader_projection() or []),
+        'tournaments': None if allowed_ids is None else sorted(allowed_ids),
+    }
+    return hashlib.blake2b(json.dumps(options, sort_keys=True).encode('utf-8'), digest_size=8).hexdigest()
+
+
+def _snapshot_path(filepath, allowed_ids=None):
+    """Путь снимка в CACHE_DIR: хэш содержимого файла + подпись параметров разбора."""
+    digest = hashlib.blake2b(digest_size=16)
+    with open(filepath, 'rb') as f:
+        for chunk in iter(lambda: f.read(JSON_STREAM_CHUNK_SIZE), b''):
+            digest.update(chunk)
+    return os.path.join(CACHE_DIR, f"snapshot_{digest.hexdigest()}_{_snapshot_signature(allowed_ids)}.npz")
+
+
+# Типы значений, которые колонка снимка хранит текстом JSON (_snapshot_json_codes)
+_SNAPSHOT_JSON_TYPES = (str, int, float, bool, type(None), list, dict)
+
+
+def _snapshot_text_codes(values):
+    """
+    Коды и словарь для текстовой колонки снимка: (codes int32, categories '<U'), пропуски — коды -1 (NaN)
+    и -2 (None), чтобы различие None/NaN сохранялось. None, если в колонке есть не только строки
+    и эти два вида пропусков (такая колонка хранится как массив объектов).
+    """
+    missing = pd.isna(values)
+    nulls = values[missing]
+    if not all(v is None or type(v) is float for v in nulls):
+        return None
+    present = values[~missing]
+    if pd.api.types.infer_dtype(present, skipna=False) not in ("string", "empty"):
+        return None
+    present_codes, categories = pd.factorize(present)
+    categories = np.asarray(categories, dtype=object)
+    # В массиве '<U' завершающие '\x00' теряются
+    if any(c.endswith('\x00') for c in categories):
+        return None
+    codes = np.full(len(values), -1, dtype=np.int32)
+    codes[~missing] = present_codes
+    codes[np.flatnonzero(missing)[np.fromiter((v is None for v in nulls), dtype=bool, count=len(nulls))]] = -2
+    return codes, categories.astype(str) if len(categories) else np.array([], dtype='<U1')
+
+
+def _snapshot_json_codes(values):
+    """
+    Коды и таблица значений для колонки снимка со смешанными значениями (без pickle): каждое значение
+    записывается текстом JSON, одинаковые тексты получают один код (int32); таблица — JSON-массив
+    текстов в байтах UTF-8. Поддерживаются значения из JSON: str, int, float (в том числе NaN), bool,
+    None, list, dict.
+    """
+    texts = []
+    for value in values.tolist():
+        if type(value) not in _SNAPSHOT_JSON_TYPES:
+            raise ValueError(f"значение типа {type(value).__name__} не поддерживается снимком")
+        texts.append(json.dumps(value, ensure_ascii=False))
+    codes, table = pd.factorize(np.array(texts, dtype=object))
+    table = json.dumps(table.tolist(), ensure_ascii=False).encode('utf-8', 'surrogatepass')
+    return codes.astype(np.int32), np.frombuffer(table, dtype=np.uint8)
+
+
+def _snapshot_json_values(codes, table):
+    """Значения колонки из кодов и таблицы _snapshot_json_codes."""
+    texts = json.loads(table.tobytes().decode('utf-8', 'surrogatepass'))
+    uniques = np.empty(len(texts), dtype=object)
+    for i, text in enumerate(texts):
+        uniques[i] = json.loads(text)
+    values = uniques[codes]
+    # Списки и словари у каждой строки свои, как после разбора
+    shared = [i for i, value in enumerate(uniques) if isinstance(value, (list, dict))]
+    if shared:
+        for row in np.flatnonzero(np.isin(codes, shared)).tolist():
+            values[row] = json.loads(texts[codes[row]])
+    return values
+
+
+def _snapshot_arrays(df, diagnostics=None):
+    """
+    Раскладывает DataFrame по массивам numpy для np.savez: числовые колонки — как есть,
+    текстовые — кодами и словарём (_snapshot_text_codes), остальные — кодами и таблицей
+    текстов JSON (_snapshot_json_codes), поэтому снимок читается без pickle.
+    Описание колонок (имя, тип, способ хранения), df.attrs и ошибки разбора
+    (ParseDiagnostics.to_state) пишутся JSON-заголовком в массив 'meta'.
+    """
+    if not isinstance(df.index, pd.RangeIndex) or df.index.start != 0 or df.index.step != 1:
+        raise ValueError("снимок сохраняется только для DataFrame с индексом 0..n-1")
+    arrays, columns = {}, []
+    for i, (name, series) in enumerate(df.items()):
+        if not isinstance(name, str):
+            raise ValueError(f"имя колонки {name!r} не строка")
+        dtype = series.dtype
+        if isinstance(dtype, np.dtype) and dtype != object:
+            kind = "values"
+            arrays[f"v{i}"] = series.to_numpy()
+        elif dtype == object or str(dtype) == str(_text_column_dtype()):
+            values = series.to_numpy(dtype=object)
+            coded = _snapshot_text_codes(values)
+            if coded is None:
+                kind = "json"
+                arrays[f"c{i}"], arrays[f"k{i}"] = _snapshot_json_codes(values)
+            else:
+                kind = "codes"
+                arrays[f"c{i}"], arrays[f"k{i}"] = coded
+        else:
+            raise ValueError(f"тип колонки {name}: {dtype} не поддерживается снимком")
+        columns.append([name, str(dtype), kind])
+    meta = {'rows': len(df), 'columns': columns, 'attrs': df.attrs,
+            'diagnostics': None if diagnostics is None else diagnostics.to_state()}
+    arrays['meta'] = np.frombuffer(json.dumps(meta, ensure_ascii=False).encode('utf-8'), dtype=np.uint8)
+    return arrays
+
+
+def _snapshot_frame(data, meta):
+    """Собирает DataFrame из массивов снимка (см. _snapshot_arrays) с исходными типами колонок."""
+    columns = {}
+    for i, (name, dtype, kind) in enumerate(meta['columns']):
+        if kind == "codes":
+            codes = data[f"c{i}"]
+            categories = data[f"k{i}"].astype(object)
+            values = np.empty(len(codes), dtype=object)
+            present = codes >= 0
+            values[present] = categories[codes[present]]
+            values[codes == -1] = np.nan
+            values[codes == -2] = None
+        elif kind == "json":
+            values = _snapshot_json_values(data[f"c{i}"], data[f"k{i}"])
+        else:
+            values = data[f"v{i}"]
+        columns[name] = pd.Series(values, dtype=pd.api.types.pandas_dtype(dtype), copy=False)
+    df = pd.DataFrame(columns, index=pd.RangeIndex(meta['rows']))
+    df.attrs.update(meta['attrs'])
+    return df
+
+
+def read_json_snapshot(filepath, allowed_ids=None):
+    """
+    Ищет снимок разобранной выгрузки в кэше (allowed_ids — фильтр турниров, с которым разбирался файл).
+    Ошибки, которые были при разборе файла, снова выводятся в лог (SNAPSHOT_LOAD_ERRORS и сводка parse_diag).
+
+    Returns:
+        (df, cache_path): df — DataFrame из кэша или None (промах),
+        cache_path — куда сохранить снимок после разбора (None, если кэш выключен или недоступен)
+    """
+    if not SNAPSHOT_CACHE_ENABLED:
+        return None, None
+    filename = os.path.basename(filepath)
+    try:
+        cache_path = _snapshot_path(filepath, allowed_ids)
+    except OSError as ex:
+        logging.warning(LOG_MESSAGES["SNAPSHOT_ERROR"].format(filename=filename, ex=ex))
+        return None, None
+    if os.path.exists(cache_path):
+        try:
+            with np.load(cache_path, allow_pickle=False) as data:
+                meta = json.loads(data['meta'].tobytes().decode('utf-8'))
+                df = _snapshot_frame(data, meta)
+            # Время изменения — метка последнего использования для вытеснения старых снимков
+            os.utime(cache_path)
+            logging.info(LOG_MESSAGES["SNAPSHOT_HIT"].format(
+                filename=filename, path=cache_path, size_mb=os.path.getsize(cache_path) / 2 ** 20))
+            if df.attrs.get('load_errors') and meta['diagnostics'] is not None:
+                diagnostics = ParseDiagnostics.from_state(meta['diagnostics'])
+                logging.error(LOG_MESSAGES["SNAPSHOT_LOAD_ERRORS"].format(
+                    filename=filename, errors=df.attrs['load_errors'],
+                    tournaments=list(dict.fromkeys(diagnostics.failed))))
+                diagnostics.log_summary(filename)
+            return df, cache_path
+        except Exception as ex:
+            logging.warning(LOG_MESSAGES["SNAPSHOT_ERROR"].format(filename=filename, ex=ex))
             try:
-                if not isinstance(record, dict):
-                    logging.warning(LOG_MESSAGES["PROCESS_JSON_BAD_RECORD"].format(
-                        tournament_key=tournament_key, record=repr(record)[:100]))
-                    continue
-                tournament = record.get("body", {}).get("tournament", {})
-                tournament_id = tournament.get("tournamentId", tournament_key)
-                leaders = tournament.get("leaders", [])
-                if isinstance(leaders, dict):
-                    leaders = list(leaders.values())
-                elif not isinstance(leaders, list):
-                    leaders = []
-                if not leaders:
-                    stub = {
-                        'SourceFile': filename,
-                        'tournamentId': tournament_id,
-                        'employeeNumber': '00000000',
-                        'lastName': 'None',
-                        'firstName': 'None'
-                    }
-                    for field in FLOAT_FIELDS + INT_FIELDS:
-                        stub[field] = None
-                    rows.append(stub)
-                    logging.info(LOG_MESSAGES["PROCESS_JSON_EMPTY_LEADERS"].format(
-                        tournament_id=tournament_id, filename=filename))
-                    continue
-                for leader in leaders:
-                    try:
-                        row = flatten_leader(leader, tournament_id, filename)
-                        rows.append(row)
-                    except Exception as ex:
-                        logging.error(LOG_MESSAGES["PROCESS_JSON_FLATTEN_LEADER_ERROR"].format(
-                            filename=filename, tournament_id=tournament_id,
-                            employee=leader.get('employeeNumber', 'N/A'), ex=ex))
-            except Exception as ex:
-                logging.error(LOG_MESSAGES["PROCESS_JSON_RECORD_ERROR"].format(
-                    filename=filename, tournament_key=tournament_key, ex=ex))
-    return rows
+                os.remove(cache_path)
+            except OSError:
+                pass
+    logging.info(LOG_MESSAGES["SNAPSHOT_MISS"].format(filename=filename))
+    return None, cache_path
+
+
+def _evict_snapshots(keep_path):
+    """Удаляет самые давно использованные снимки, пока кэш больше SNAPSHOT_CACHE_MAX_MB."""
+    limit = SNAPSHOT_CACHE_MAX_MB * 2 ** 20
+    entries = []
+    for name in os.listdir(CACHE_DIR):
+        # Снимки прежнего формата (.pkl) тоже учитываются, чтобы вытесняться по общему лимиту
+        if name.startswith("snapshot_") and name.endswith((".npz", ".pkl")):
+            path = os.path.join(CACHE_DIR, name)
+            stat = os.stat(path)
+            entries.append((stat.st_mtime, stat.st_size, path))
+    total = sum(size for _, size, _ in entries)
+    for _, size, path in sorted(entries):
+        if total <= limit:
+            break
+        if path == keep_path:
+            continue
+        os.remove(path)
+        total -= size
+        logging.info(LOG_MESSAGES["SNAPSHOT_EVICTED"].format(
+            path=path, size_mb=size / 2 ** 20, limit_mb=SNAPSHOT_CACHE_MAX_MB))
+
+
+def write_json_snapshot(cache_path, df, filepath, diagnostics=None):
+    """
+    Сохраняет снимок разобранной выгрузки (по колонкам в .npz, запись через временный файл)
+    и ограничивает размер кэша. diagnostics — ParseDiagnostics разбора файла: ошибки хранятся в снимке
+    и выводятся в лог при загрузке из кэша (read_json_snapshot).
+    """
+    if cache_path is None or df.empty:
+        return
+    filename = os.path.basename(filepath)
+    try:
+        os.makedirs(CACHE_DIR, exist_ok=True)
+        tmp_path = f"{cache_path}.{os.getpid()}.tmp"
+        arrays = _snapshot_arrays(df, diagnostics)
+        # Файловый объект: np.savez не добавляет к имени суффикс .npz
+        with open(tmp_path, 'wb') as f:
+            np.savez(f, **arrays)
+        os.replace(tmp_path, cache_path)
+        logging.info(LOG_MESSAGES["SNAPSHOT_SAVED"].format(
+            filename=filename, path=cache_path, size_mb=os.path.getsize(cache_path) / 2 ** 20))
+        _evict_snapshots(cache_path)
+    except Exception as ex:
+        logging.warning(LOG_MESSAGES["SNAPSHOT_ERROR"].format(filename=filename, ex=ex))
+
+
+def process_json_file_cached(filepath, allowed_ids=None):
+    """process_json_file с кэшем снимков: при попадании файл не разбирается."""
+    df, cache_path = read_json_snapshot(filepath, allowed_ids)
+    if df is None:
+        diagnostics = ParseDiagnostics()
+        df = process_json_file(filepath, allowed_ids, diagnostics=diagnostics)
+        write_json_snapshot(cache_path, df, filepath, diagnostics)
+    return df
+
 
 def filter_dataframe_by_tournaments(df, allowed_ids, filter_enabled, label="DataFrame"):
     """
@@ -690,8 +2203,11 @@ def filter_dataframe_by_tournaments(df, allowed_ids, filter_enabled, label="Data
     
     Returns:
         Отфильтрованный DataFrame
+
+    Если турниры уже отфильтрованы при разборе (process_json_file с allowed_ids),
+    исходное число строк берётся из df.attrs['rows_before_filter'].
     """
-    original_count = len(df)
+    original_count = df.attrs.get('rows_before_filter', len(df))
     
     # Если фильтрация отключена, возвращаем без изменений
     if not filter_enabled:
@@ -705,6 +2221,7 @@ def filter_dataframe_by_tournaments(df, allowed_ids, filter_enabled, label="Data
     
     # Применяем фильтрацию
     filtered_df = df[df['tournamentId'].isin(allowed_ids)]
+    filtered_df.attrs = {key: value for key, value in filtered_df.attrs.items() if key != 'rows_before_filter'}
     filtered_count = len(filtered_df)
     
     logging.info(f"[{label}] Применена фильтрация по турнирам: {original_count} -> {filtered_count} строк")
@@ -712,248 +2229,627 @@ def filter_dataframe_by_tournaments(df, allowed_ids, filter_enabled, label="Data
     
     return filtered_df
 
-def select_best_status_and_level(row, field_type="placeInRating"):
+def tournament_digests(df, label="DataFrame", columns=None):
     """
-    Выбирает лучший доступный статус из трех уровней (BANK -> TB -> GOSB).
-    
-    Args:
-        row: строка DataFrame
-        field_type: тип поля ("placeInRating" или "ratingCategoryName")
-    
-    Returns:
-        tuple: (before_value, after_value, compare_status, level)
-    """
-    levels = ["BANK", "TB", "GOSB"]
-    
-    for level in levels:
-        compare_col = f'divisionRatings_{level}_{field_type}_Compare'
-        before_col = f'BEFORE_divisionRatings_{level}_{field_type}'
-        after_col = f'AFTER_divisionRatings_{level}_{field_type}'
-        
-        if compare_col in row:
-            status = row[compare_col]
-            # Для placeInRating проверяем "Нет места", для ratingCategoryName - пустые значения
-            if field_type == "placeInRating":
-                if pd.notnull(status) and str(status).strip() != "Нет места":
-                    return (
-                        row.get(before_col), 
-                        row.get(after_col), 
-                        status, 
-                        level
-                    )
-            else:  # ratingCategoryName
-                if pd.notnull(status) and str(status).strip() not in ["", "Нет призового значения", "Не участвовал"]:
-                    return (
-                        row.get(before_col), 
-                        row.get(after_col), 
-                        status, 
-                        level
-                    )
-    
-    # Если не нашли подходящий статус, возвращаем значения из BANK уровня
-    level = "BANK"
-    compare_col = f'divisionRatings_{level}_{field_type}_Compare'
-    before_col = f'BEFORE_divisionRatings_{level}_{field_type}'
-    after_col = f'AFTER_divisionRatings_{level}_{field_type}'
-    
-    fallback_status = "Нет места" if field_type == "placeInRating" else "Нет призового значения"
-    
-    return (
-        row.get(before_col), 
-        row.get(after_col), 
-        row.get(compare_col, fallback_status), 
-        level
-    )
+    Контрольные суммы содержимого турниров по колонкам сравнения.
 
-def get_status_description(status):
-    """
-    Получает подробное описание статуса из STATUS_LEGEND_FULL.
-    
     Args:
-        status: статус для поиска описания
-    
+        df: загруженная таблица (до compact_frame)
+        label: название таблицы для лога
+        columns: колонки суммы (None — COMPARE_KEYS и COMPARE_FIELDS без TOURNAMENT_DIGEST_IGNORE_FIELDS)
+
     Returns:
-        str: подробное описание статуса или пустая строка
+        словарь {tournamentId: hex}. В сумму входят типы колонок, число строк турнира
+        и хэши строк в их порядке, поэтому равные суммы означают одинаковые строки
+        в том же порядке. Для object-колонок со смешанными типами хэшируются и имена типов.
     """
-    if not status or pd.isnull(status):
-        return ""
-    
-    status_str = str(status).strip()
-    for legend_item in STATUS_LEGEND_FULL:
-        if len(legend_item) >= 3 and legend_item[0] == status_str:
-            return legend_item[2]  # третий элемент - описание
-    
-    return ""
-
-def create_summary_row(row, tournament_name):
+    t_start = time.perf_counter()
+    if columns is None:
+        columns = [c for c in COMPARE_KEYS + COMPARE_FIELDS if c not in TOURNAMENT_DIGEST_IGNORE_FIELDS]
+    if df.empty or 'tournamentId' not in df.columns:
+        return {}
+    frame = df.reindex(columns=columns)
+    signature, parts = [], {}
+    for col in columns:
+        series = frame[col]
+        kind = str(series.dtype)
+        if series.dtype == object:
+            kind = pd.api.types.infer_dtype(series, skipna=True)
+            if kind.startswith('mixed'):
+                parts[f'{col}:type'] = series.map(lambda value: type(value).__name__)
+        signature.append(f'{col}:{kind}')
+        parts[col] = series
+    signature = json.dumps(signature).encode('utf-8')
+    row_hashes = pd.util.hash_pandas_object(pd.DataFrame(parts), index=False, categorize=False).to_numpy()
+
+    codes, uniques = pd.factorize(df['tournamentId'])
+    order = np.argsort(codes, kind='stable')
+    counts = np.bincount(codes[codes >= 0], minlength=len(uniques))
+    bounds = np.concatenate([[0], np.cumsum(counts)]) + np.count_nonzero(codes < 0)
+    digests = {}
+    for i, tournament_id in enumerate(uniques):
+        digest = hashlib.blake2b(signature, digest_size=16)
+        digest.update(int(counts[i]).to_bytes(8, 'little'))
+        digest.update(row_hashes[order[bounds[i]:bounds[i + 1]]].tobytes())
+        digests[tournament_id] = digest.hexdigest()
+    logging.info(LOG_MESSAGES["TOURNAMENT_DIGESTS_DONE"].format(
+        label=label, count=len(digests), seconds=time.perf_counter() - t_start))
+    return digests
+
+
+def find_unchanged_tournaments(before_digests, after_digests):
+    """Турниры, контрольные суммы которых совпали в BEFORE и AFTER (frozenset)."""
+    unchanged = frozenset(tid for tid, digest in before_digests.items() if after_digests.get(tid) == digest)
+    logging.info(LOG_MESSAGES["COMPARE_UNCHANGED_TOURNAMENTS"].format(
+        count=len(unchanged), total=len(set(before_digests) | set(after_digests))))
+    return unchanged
+
+
+def _compact_series(series, category_max_ratio):
     """
-    Создает итоговую строку с описанием изменений.
-    
-    Args:
-        row: строка DataFrame
-        tournament_name: название турнира
-    
+    Подбирает компактный тип для колонки.
+    Returns: (новая колонка, (исходный dtype, вид пустых значений)) или None, если колонку не трогаем.
+    """
+    n = len(series)
+    dtype = series.dtype
+    if pd.api.types.is_bool_dtype(dtype) or isinstance(dtype, pd.CategoricalDtype):
+        return None
+    if pd.api.types.is_float_dtype(dtype) or pd.api.types.is_integer_dtype(dtype):
+        if pd.api.types.is_extension_array_dtype(dtype):
+            return None
+        values = series.to_numpy(dtype=np.float64)
+        present = values[~np.isnan(values)]
+        if not present.size:
+            return None
+        # Целые значения (места, groupId): Int32 без потерь, если нет -0.0 и значения в диапазоне int32
+        if (np.all(np.isfinite(present)) and np.all(present == np.floor(present))
+                and present.min() >= -2 ** 31 and present.max() < 2 ** 31
+                and not np.signbit(present[present == 0]).any()):
+            return series.astype("Int32"), (dtype, None)
+        if dtype == np.float64:
+            as_float32 = values.astype(np.float32)
+            if np.array_equal(as_float32.astype(np.float64), values, equal_nan=True):
+                return pd.Series(as_float32, index=series.index, name=series.name), (dtype, None)
+        return None
+    if dtype != object and not pd.api.types.is_string_dtype(dtype):
+        return None
+    # Только колонки из строк: у смешанных типов category может склеить равные значения (1 и True)
+    if pd.api.types.infer_dtype(series, skipna=True) != "string":
+        return None
+    if series.nunique(dropna=True) > n * category_max_ratio:
+        return None
+    null_kind = None
+    if dtype == object:
+        nulls = series[series.isna()]
+        has_none = any(v is None for v in nulls)
+        # None и NaN в одной колонке category не различает — такую колонку не трогаем
+        if has_none and len(nulls) and not all(v is None for v in nulls):
+            return None
+        null_kind = "none" if has_none else "nan"
+    return series.astype("category"), (dtype, null_kind)
+
+
+def compact_frame(df, label, category_max_ratio=None):
+    """
+    Переводит колонки DataFrame в компактные типы (COMPACT_DTYPES):
+    повторяющиеся строки — category, целые места/ID — Int32, вещественные — float32 без потерь.
+    Исходные типы сохраняются в df.attrs['compact_dtypes'] для restore_frame_dtypes.
+    Память до и после пишется в лог.
+    """
+    if not COMPACT_DTYPES or df.empty:
+        return df
+    if category_max_ratio is None:
+        category_max_ratio = COMPACT_CATEGORY_MAX_RATIO
+    mem_before = df.memory_usage(deep=True).sum()
+    plan = dict(df.attrs.get('compact_dtypes', {}))
+    compacted = {}
+    for col in df.columns:
+        if col in plan:
+            continue
+        result = _compact_series(df[col], category_max_ratio)
+        if result is not None:
+            compacted[col], plan[col] = result
+    if compacted:
+        df = df.copy(deep=False)
+        for col, series in compacted.items():
+            df[col] = series
+        df.attrs['compact_dtypes'] = plan
+    logging.info(LOG_MESSAGES["COMPACT_FRAME_DONE"].format(
+        label=label, before_mb=mem_before / 2 ** 20,
+        after_mb=df.memory_usage(deep=True).sum() / 2 ** 20,
+        columns={col: str(series.dtype) for col, series in compacted.items()}))
+    return df
+
+
+def restore_series_dtype(series, plan):
+    """Колонка с исходным типом по записи плана compact_frame ((dtype, null_kind) или None — без изменений)."""
+    if plan is None:
+        return series
+    dtype, null_kind = plan
+    restored = series.astype(dtype)
+    if null_kind == "none":
+        restored = restored.where(restored.notna(), None)
+    return restored
+
+
+def restore_frame_dtypes(df):
+    """
+    Возвращает копию DataFrame с исходными типами колонок (обратное к compact_frame).
+    Чтобы не восстанавливать всю таблицу, достаточно передать выборку колонок (df[columns]) —
+    план типов переходит в неё вместе с attrs.
+    """
+    plan = df.attrs.get('compact_dtypes')
+    if not plan:
+        return df
+    df = df.copy(deep=False)
+    for col, spec in plan.items():
+        if col in df.columns:
+            df[col] = restore_series_dtype(df[col], spec)
+    df.attrs = {key: value for key, value in df.attrs.items() if key != 'compact_dtypes'}
+    return df
+
+
+def _usable_status_mask(series, skip):
+    """Маска строк, где статус заполнен и не входит в skip (после strip), — по уникальным значениям."""
+    codes, uniques = pd.factorize(series, use_na_sentinel=True)
+    usable = np.array([str(value).strip() not in skip for value in uniques] + [False], dtype=bool)
+    return usable[codes]
+
+
+def select_best_status_and_level_columns(df, field_type="placeInRating"):
+    """
+    Лучший доступный статус из трех уровней (BANK -> TB -> GOSB) для всех строк таблицы сравнения.
+
+    Уровень выбирается масками по колонкам divisionRatings_{level}_{field_type}_Compare
+    в порядке BANK -> TB -> GOSB: для placeInRating пропускается "Нет места", для ratingCategoryName —
+    пустые и служебные статусы. Если подходящего статуса нет — уровень BANK и его статус
+    ("Нет места" / "Нет призового значения", если колонки статуса нет).
+    Значения приводятся к строкам: before/after — str(), None остаётся None; статус и уровень — str().
+
     Returns:
-        str: итоговая строка
+        tuple: (before, after, status, level) — списки по строкам df
     """
-    # Очищаем название турнира - берем только часть до скобки с ID
-    if tournament_name and tournament_name != "Неизвестный турнир":
-        # Ищем скобку с ID и берем только часть до неё
-        if '(' in tournament_name:
-            tournament = tournament_name.split('(')[0].strip()
-        else:
-            tournament = tournament_name
+    levels = ["BANK", "TB", "GOSB"]
+    if field_type == "placeInRating":
+        skip, fallback_status = {"Нет места"}, "Нет места"
     else:
-        tournament = "Неизвестный турнир"
-    
-    # Получаем места и приводим к целым числам
-    before_place_raw = row.get('BEFORE_divisionRatings_BANK_placeInRating', '')
-    after_place_raw = row.get('AFTER_divisionRatings_BANK_placeInRating', '')
-    
-    # Преобразуем в целые числа, если возможно
-    try:
-        before_place = int(float(before_place_raw)) if pd.notnull(before_place_raw) and str(before_place_raw).strip() != '' else ''
-    except (ValueError, TypeError):
-        before_place = before_place_raw
-    
+        skip, fallback_status = {"", "Нет призового значения", "Не участвовал"}, "Нет призового значения"
+    n = len(df)
+
+    # Индекс выбранного уровня по строкам (0 — BANK, он же уровень по умолчанию)
+    chosen = np.zeros(n, dtype=np.int8)
+    found = np.zeros(n, dtype=bool)
+    for i, level in enumerate(levels):
+        compare_col = f'divisionRatings_{level}_{field_type}_Compare'
+        if compare_col in df.columns:
+            take = _usable_status_mask(df[compare_col], skip) & ~found
+            chosen[take] = i
+            found |= take
+
+    def gather(column, rows, default):
+        if column in df.columns:
+            return df[column].iloc[rows].to_numpy(dtype=object)
+        return np.full(len(rows), default, dtype=object)
+
+    before = np.full(n, None, dtype=object)
+    after = np.full(n, None, dtype=object)
+    status = np.full(n, fallback_status, dtype=object)
+    for i, level in enumerate(levels):
+        rows = np.flatnonzero(chosen == i)
+        if not len(rows):
+            continue
+        before[rows] = gather(f'BEFORE_divisionRatings_{level}_{field_type}', rows, None)
+        after[rows] = gather(f'AFTER_divisionRatings_{level}_{field_type}', rows, None)
+        status[rows] = gather(f'divisionRatings_{level}_{field_type}_Compare', rows, fallback_status)
+
+    return (
+        [str(value) if value is not None else None for value in before],
+        [str(value) if value is not None else None for value in after],
+        [str(value) for value in status],
+        np.array(levels, dtype=object)[chosen].tolist(),
+    )
+
+
+def status_description_map():
+    """{статус: подробное описание} из STATUS_LEGEND_FULL (при повторах — первое вхождение)."""
+    descriptions = {}
+    for legend_item in STATUS_LEGEND_FULL:
+        if len(legend_item) >= 3:
+            descriptions.setdefault(legend_item[0], legend_item[2])  # третий элемент - описание
+    return descriptions
+
+
+def status_descriptions(statuses):
+    """
+    Подробные описания статусов из STATUS_LEGEND_FULL для целой колонки
+    ("" — статус пустой или не найден); описание ищется один раз на уникальный статус.
+    """
+    descriptions = status_description_map()
+    codes, uniques = pd.factorize(pd.Series(statuses, dtype=object), use_na_sentinel=True)
+    values = [descriptions.get(str(status).strip(), "") if status else "" for status in uniques]
+    return np.array(values + [""], dtype=object)[codes]
+
+
+def _short_tournament_name(tournament_name):
+    """Название турнира для 'Итого' — часть до скобки с ID."""
+    if isinstance(tournament_name, str) and tournament_name and tournament_name != "Неизвестный турнир":
+        if '(' in tournament_name:
+            return tournament_name.split('(')[0].strip()
+        return tournament_name
+    return "Неизвестный турнир"
+
+
+def _summary_place(place_raw):
+    """Место для 'Итого': целое число, '' для пустого значения, исходное значение, если это не число."""
     try:
-        after_place = int(float(after_place_raw)) if pd.notnull(after_place_raw) and str(after_place_raw).strip() != '' else ''
-    except (ValueError, TypeError):
-        after_place = after_place_raw
-    
-    status_description = row.get('описание статуса награды подробное', '')
-    
-    # Формируем итоговую строку
-    summary = f"Турнир: {tournament}. "
-    summary += f"Рейтинг в турнире на прошлой неделе: {before_place} "
-    summary += f"Текущий рейтинг: {after_place} "
-    summary += f"{status_description};"
-    
-    return summary
+        return int(float(place_raw)) if pd.notnull(place_raw) and str(place_raw).strip() != '' else ''
+    except (ValueError, TypeError, OverflowError):
+        return place_raw
 
-def make_compare_sheet(df_before, df_after, sheet_name, tid_to_fullname=None):
-    logging.info(LOG_MESSAGES["COMPARE_SHEET_START"])
 
-    join_keys = COMPARE_KEYS
-    before_uniq = df_before.drop_duplicates(subset=join_keys, keep='last')
-    after_uniq  = df_after.drop_duplicates(subset=join_keys, keep='last')
-    all_keys = pd.concat([before_uniq[join_keys], after_uniq[join_keys]]).drop_duplicates()
-    before_uniq = before_uniq.set_index(join_keys)
-    after_uniq  = after_uniq.set_index(join_keys)
-    before_uniq = before_uniq[COMPARE_FIELDS] if len(before_uniq) else pd.DataFrame(columns=COMPARE_FIELDS)
-    after_uniq  = after_uniq[COMPARE_FIELDS]  if len(after_uniq) else pd.DataFrame(columns=COMPARE_FIELDS)
-    before_uniq = before_uniq.add_prefix('BEFORE_')
-    after_uniq  = after_uniq.add_prefix('AFTER_')
-    compare_df = all_keys.set_index(join_keys) \
-        .join(before_uniq, how='left') \
-        .join(after_uniq, how='left') \
-        .reset_index()
-
-    # indicatorValue_Compare
-    def value_compare(row):
-        before = row.get('BEFORE_indicatorValue', None)
-        after  = row.get('AFTER_indicatorValue', None)
-        if pd.isnull(before) and not pd.isnull(after):
-            return STATUS_INDICATOR['val_add']
-        if not pd.isnull(before) and pd.isnull(after):
-            return STATUS_INDICATOR['val_remove']
-        if pd.isnull(before) and pd.isnull(after):
-            return ""
-        if before == after:
-            return STATUS_INDICATOR['val_nochange']
-        elif before > after:
-            return STATUS_INDICATOR['val_down']
-        else:
-            return STATUS_INDICATOR['val_up']
-    compare_df['indicatorValue_Compare'] = compare_df.apply(value_compare, axis=1)
-
-    def rang_compare(row, before_col, after_col, status_dict):
-        before = row.get(f'BEFORE_{before_col}', None)
-        after  = row.get(f'AFTER_{after_col}', None)
-        if pd.isnull(before) and not pd.isnull(after):
-            return status_dict['val_add']
-        if not pd.isnull(before) and pd.isnull(after):
-            return status_dict['val_remove']
-        if pd.isnull(before) and pd.isnull(after):
-            return status_dict.get('val_norank', 'Нет места')
-        if before == after:
-            return status_dict['val_nochange']
-        elif before > after:
-            return status_dict['val_up']
+def _map_unique(series, func, missing):
+    """Применяет func к уникальным значениям колонки и раскладывает результат по строкам (строки)."""
+    codes, uniques = pd.factorize(series, use_na_sentinel=True)
+    values = [str(func(value)) for value in uniques]
+    return np.array(values + [missing], dtype=object)[codes]
+
+
+def build_compare_summary(df):
+    """
+    Колонка 'Итого' для таблицы сравнения целиком: "Турнир: {название}. Рейтинг в турнире на прошлой неделе:
+    {BEFORE} Текущий рейтинг: {AFTER} {описание статуса};", места — целые числа без дробной части.
+
+    Короткие названия турниров, места и описания считаются один раз на уникальное значение,
+    затем строки собираются одним проходом по готовым колонкам.
+
+    Returns:
+        numpy-массив строк по строкам df
+    """
+    n = len(df)
+
+    def column(name):
+        return df[name] if name in df.columns else pd.Series([''] * n, index=df.index, dtype=object)
+
+    tournament = _map_unique(column('tournamentName'), _short_tournament_name, "Неизвестный турнир")
+    before_place = _map_unique(column('BEFORE_divisionRatings_BANK_placeInRating'), _summary_place, '')
+    after_place = _map_unique(column('AFTER_divisionRatings_BANK_placeInRating'), _summary_place, '')
+    description = _map_unique(column('описание статуса награды подробное'), lambda value: value, 'nan')
+    summary = [f"Турнир: {t}. Рейтинг в турнире на прошлой неделе: {b} Текущий рейтинг: {a} {d};"
+               for t, b, a, d in zip(tournament.tolist(), before_place.tolist(), after_place.tolist(), description.tolist())]
+    return np.array(summary, dtype=object)
+
+
+def compare_values_status(df, column, statuses, same=None):
+    """
+    Векторное сравнение колонок BEFORE_{column} и AFTER_{column} (вместо построчного apply).
+
+    Args:
+        df: объединённая таблица сравнения
+        column: имя поля без префикса
+        statuses: (появилось, пропало, пусто до и после, равны, BEFORE больше, BEFORE меньше)
+        same: маска строк, где значения BEFORE и AFTER заведомо равны (турниры без изменений) —
+              им статус «равны» ставится без сравнения
+
+    Returns:
+        numpy-массив статусов по строкам df. Значения сравниваются теми же операциями
+        ==, > и только там, где оба значения заполнены, поэтому результат совпадает с построчным.
+    """
+    added, removed, empty, equal, greater, less = statuses
+    n = len(df)
+    before_col, after_col = f'BEFORE_{column}', f'AFTER_{column}'
+    if before_col in df.columns:
+        before, before_null = df[before_col].to_numpy(), df[before_col].isna().to_numpy()
+    else:
+        before, before_null = np.full(n, None, dtype=object), np.ones(n, dtype=bool)
+    if after_col in df.columns:
+        after, after_null = df[after_col].to_numpy(), df[after_col].isna().to_numpy()
+    else:
+        after, after_null = np.full(n, None, dtype=object), np.ones(n, dtype=bool)
+
+    result = np.full(n, empty, dtype=object)
+    result[before_null & ~after_null] = added
+    result[~before_null & after_null] = removed
+    both = ~before_null & ~after_null
+    if same is not None:
+        result[both & same] = equal
+        both &= ~same
+    both = np.flatnonzero(both)
+    same = np.asarray(before[both] == after[both], dtype=bool)
+    result[both[same]] = equal
+    changed = both[~same]
+    higher = np.asarray(before[changed] > after[changed], dtype=bool)
+    result[changed[higher]] = greater
+    result[changed[~higher]] = less
+    return result
+
+
+def nochange_rows_mask(df, columns=None, nochange_statuses=None):
+    """
+    Векторная маска строк без изменений: во всех колонках columns (по умолчанию COMPARE_STATUS_COLUMNS)
+    значение str(v).strip() входит в nochange_statuses (по умолчанию NOCHANGE_STATUSES).
+
+    Совпадает с построчной проверкой is_any_change (отсутствующая колонка считается пустой строкой):
+    строка проверяется один раз на уникальное значение колонки, пустые значения — поштучно,
+    т.к. str(None) и str(nan) различаются.
+    """
+    columns = COMPARE_STATUS_COLUMNS if columns is None else columns
+    nochange = set(NOCHANGE_STATUSES if nochange_statuses is None else nochange_statuses)
+    if not nochange and columns:
+        return np.zeros(len(df), dtype=bool)
+    mask = np.ones(len(df), dtype=bool)
+    for col in columns:
+        if col not in df.columns:
+            if "" not in nochange:
+                mask[:] = False
+            continue
+        values = df[col].to_numpy(dtype=object)
+        codes, uniques = pd.factorize(values)
+        unique_same = np.array([str(u).strip() in nochange for u in uniques], dtype=bool)
+        same = unique_same[codes] if len(uniques) else np.zeros(len(values), dtype=bool)
+        for i in np.flatnonzero(codes < 0):
+            same[i] = str(values[i]).strip() in nochange
+        mask &= same
+    return mask
+
+
+class CategoryTransitions:
+    """
+    category_compare_lookup, скомпилированный в плотную таблицу переходов.
+
+    Категория одной стороны кодируется числом: 0 — категории нет (пусто/None),
+    1..K — ранги CATEGORY_RANK_MAP по возрастанию, K+1 — категория вне CATEGORY_RANK_MAP
+    (для неё, как и раньше, статус пустой). table[код BEFORE, код AFTER] — индекс описания в descriptions.
+    При создании проверяется, что для каждой пары известных кодов в lookup есть запись,
+    иначе ValueError — пропуск в таблице обнаруживается при запуске, а не пустыми статусами.
+    """
+
+    def __init__(self, lookup=None, rank_map=None):
+        lookup = category_compare_lookup if lookup is None else lookup
+        self.rank_map = CATEGORY_RANK_MAP if rank_map is None else rank_map
+        self.ranks = sorted({rank for rank in self.rank_map.values() if rank is not None})
+        self._rank_codes = {rank: code for code, rank in enumerate(self.ranks, 1)}
+        self.unknown_code = len(self.ranks) + 1
+        # Ключ lookup для каждого известного кода: (present, rank)
+        sides = [(0, None)] + [(1, rank) for rank in self.ranks]
+        self.descriptions = np.array([""] + sorted({v["desc_ru"] for v in lookup.values()}), dtype=object)
+        desc_index = {desc: i for i, desc in enumerate(self.descriptions)}
+        size = self.unknown_code + 1
+        self.table = np.zeros((size, size), dtype=np.int16)
+        missing = []
+        for b_code, (b_present, b_rank) in enumerate(sides):
+            for a_code, (a_present, a_rank) in enumerate(sides):
+                key = (b_present, b_rank, a_present, a_rank)
+                if key in lookup:
+                    self.table[b_code, a_code] = desc_index[lookup[key]["desc_ru"]]
+                else:
+                    missing.append(key)
+        if missing:
+            message = LOG_MESSAGES["CATEGORY_TRANSITIONS_GAP"].format(keys=missing)
+            logging.error(message)
+            raise ValueError(message)
+        logging.info(LOG_MESSAGES["CATEGORY_TRANSITIONS_READY"].format(ranks=self.ranks, size=size))
+
+    def encode(self, values):
+        """Коды категорий колонки (по уникальным значениям — как category_compare_enhanced для каждой ячейки)."""
+        codes, uniques = pd.factorize(pd.Series(values, dtype=object), use_na_sentinel=True)
+        unique_codes = np.zeros(len(uniques) + 1, dtype=np.int16)
+        for i, value in enumerate(uniques):
+            if pd.isnull(value) or value == "":
+                continue
+            rank = self.rank_map.get(value, None)
+            unique_codes[i] = self._rank_codes[rank] if rank is not None else self.unknown_code
+        # Код -1 (пустые значения) попадает на последний элемент — 0
+        return unique_codes[codes]
+
+    def compare(self, before, after):
+        """Описания переходов для массивов кодов BEFORE/AFTER одной формы."""
+        return self.descriptions[self.table[before, after]]
+
+
+def factorize_compare_keys(frames, keys):
+    """
+    Общие int64-коды составного ключа для нескольких таблиц.
+
+    Каждая колонка ключа факторизуется один раз по всем таблицам сразу, коды колонок
+    объединяются в один (с пересжатием после каждой колонки, чтобы не выйти за int64).
+    Пустые значения ключа (None/NaN) равны друг другу — как в drop_duplicates.
+
+    Returns:
+        список массивов кодов — по одному на таблицу
+    """
+    lengths = [len(frame) for frame in frames]
+    codes = np.zeros(sum(lengths), dtype=np.int64)
+    for key in keys:
+        column = pd.concat([frame[key] for frame in frames], ignore_index=True)
+        key_codes, uniques = pd.factorize(column, use_na_sentinel=True)
+        key_codes = np.where(key_codes < 0, len(uniques), key_codes)
+        codes, _ = pd.factorize(codes * (len(uniques) + 1) + key_codes)
+        codes = codes.astype(np.int64, copy=False)
+    return np.split(codes, np.cumsum(lengths)[:-1])
+
+
+def _last_key_positions(codes):
+    """Позиции последних вхождений каждого кода в порядке строк (как drop_duplicates(keep='last'))."""
+    return np.flatnonzero(~pd.Series(codes).duplicated(keep='last').to_numpy())
+
+
+def _pair_unchanged_rows(before_ids, after_ids):
+    """
+    Попарное сопоставление строк турниров с одинаковым содержимым.
+
+    Содержимое турнира в BEFORE и AFTER совпадает строка в строку, поэтому k-я строка
+    турнира в BEFORE соответствует k-й строке того же турнира в AFTER.
+
+    Returns:
+        (before_order, after_order) — позиции строк, упорядоченные по турниру одинаково
+    """
+    codes, _ = pd.factorize(pd.concat([before_ids, after_ids], ignore_index=True))
+    before_order = np.argsort(codes[:len(before_ids)], kind='stable')
+    after_order = np.argsort(codes[len(before_ids):], kind='stable')
+    return before_order, after_order
+
+
+def align_compare_frames(df_before, df_after, keys, fields, unchanged_ids=None, return_positions=False,
+                         keep_empty_dtypes=False):
+    """
+    Внешнее объединение BEFORE и AFTER по составному ключу на целочисленных кодах.
+
+    Результат тот же, что у drop_duplicates(keep='last') обеих таблиц, объединения ключей
+    и двух join по MultiIndex: порядок строк — ключи BEFORE, затем новые ключи AFTER;
+    колонки — keys, BEFORE_{fields}, AFTER_{fields}. Дубли и выравнивание считаются по
+    int64-кодам (factorize_compare_keys), строковые колонки ключа подставляются в конце.
+
+    unchanged_ids: турниры с одинаковым содержимым в обеих таблицах (см. find_unchanged_tournaments) —
+                   их строки сопоставляются по порядку внутри турнира, ключи AFTER не факторизуются.
+    return_positions: вернуть также позиции исходных строк BEFORE и AFTER для каждой строки результата
+                      (-1 — строки нет): (compare_df, before_index, after_index)
+    keep_empty_dtypes: пустая таблица сохраняет типы своих колонок (части параллельного сравнения);
+                       по умолчанию колонки пустой выгрузки — object, как при join с пустой таблицей
+
+    Таблицы могут быть компактными (compact_frame): колонки ключа восстанавливаются целиком,
+    колонки fields — только для попавших в результат строк, поэтому полные копии BEFORE и AFTER
+    не создаются.
+    """
+    plans = [frame.attrs.get('compact_dtypes') or {} for frame in (df_before, df_after)]
+    before_key_df, after_key_df = (restore_frame_dtypes(frame[keys]) for frame in (df_before, df_after))
+    before_same = np.zeros(len(df_before), dtype=bool)
+    after_same = np.zeros(len(df_after), dtype=bool)
+    if unchanged_ids:
+        before_same = before_key_df['tournamentId'].isin(unchanged_ids).to_numpy()
+        after_same = after_key_df['tournamentId'].isin(unchanged_ids).to_numpy()
+    before_rows, after_rows = np.flatnonzero(~before_same), np.flatnonzero(~after_same)
+    before_codes, after_codes = factorize_compare_keys(
+        [before_key_df.iloc[before_rows], after_key_df.iloc[after_rows]], keys)
+    # Последнее вхождение каждого ключа, в порядке строк
+    before_kept = _last_key_positions(before_codes)
+    after_kept = _last_key_positions(after_codes)
+    before_keys, after_keys = before_codes[before_kept], after_codes[after_kept]
+    before_kept, after_kept = before_rows[before_kept], after_rows[after_kept]
+    # Для каждой строки BEFORE — позиция парной строки AFTER (-1 — ключ пропал)
+    after_of_before = np.full(len(df_before), -1, dtype=np.int64)
+    match = pd.Index(after_keys).get_indexer(before_keys)
+    after_of_before[before_kept[match >= 0]] = after_kept[match[match >= 0]]
+    new_after = after_kept[~np.isin(after_keys, before_keys)]
+
+    if before_same.any():
+        same_before, same_after = np.flatnonzero(before_same), np.flatnonzero(after_same)
+        before_order, after_order = _pair_unchanged_rows(
+            before_key_df['tournamentId'].iloc[same_before], after_key_df['tournamentId'].iloc[same_after])
+        after_of_before[same_before[before_order]] = same_after[after_order]
+        same_kept = same_before[_last_key_positions(
+            factorize_compare_keys([before_key_df.iloc[same_before]], keys)[0])]
+        before_kept = np.sort(np.concatenate([before_kept, same_kept]))
+        after_kept = np.sort(np.concatenate([after_kept, after_of_before[same_kept]]))
+
+    # Строки результата: позиции в BEFORE и AFTER (-1 — строки нет)
+    before_index = np.concatenate([before_kept, np.full(len(new_after), -1, dtype=np.int64)])
+    after_index = np.concatenate([after_of_before[before_kept], new_after])
+
+    # Колонки ключа — из тех же строк и с теми же типами, что дало бы объединение таблиц ключей
+    all_keys = pd.concat([before_key_df.iloc[before_kept], after_key_df.iloc[after_kept]], ignore_index=True)
+    all_keys = all_keys.iloc[np.concatenate([
+        np.arange(len(before_kept)), len(before_kept) + np.searchsorted(after_kept, new_after)])]
+    # MultiIndex из кодов без сортировки уровней: reset_index даёт те же значения и типы, что set_index
+    levels, level_codes = [], []
+    for key in keys:
+        codes, uniques = pd.factorize(all_keys[key])
+        levels.append(pd.Index(uniques))
+        level_codes.append(codes)
+    key_index = pd.MultiIndex(levels=levels, codes=level_codes, names=keys, verify_integrity=False)
+
+    parts = []
+    for frame, plan, kept, index, prefix in ((df_before, plans[0], before_kept, before_index, 'BEFORE_'),
+                                             (df_after, plans[1], after_kept, after_index, 'AFTER_')):
+        if len(kept) or keep_empty_dtypes:
+            values = pd.DataFrame({
+                field: restore_series_dtype(frame[field].iloc[kept], plan.get(field)).reset_index(drop=True)
+                for field in fields})
         else:
-            return status_dict['val_down']
-
-    compare_df['divisionRatings_BANK_placeInRating_Compare'] = compare_df.apply(
-        lambda row: rang_compare(row, 'divisionRatings_BANK_placeInRating', 'divisionRatings_BANK_placeInRating', STATUS_BANK_PLACE), axis=1)
-    compare_df['divisionRatings_TB_placeInRating_Compare'] = compare_df.apply(
-        lambda row: rang_compare(row, 'divisionRatings_TB_placeInRating', 'divisionRatings_TB_placeInRating', STATUS_TB_PLACE), axis=1)
-    compare_df['divisionRatings_GOSB_placeInRating_Compare'] = compare_df.apply(
-        lambda row: rang_compare(row, 'divisionRatings_GOSB_placeInRating', 'divisionRatings_GOSB_placeInRating', STATUS_GOSB_PLACE), axis=1)
-
-    # === Функция сравнения категорий ===
-    def category_compare_enhanced(row, colname):
-        before_cat = row.get(f'BEFORE_{colname}')
-        after_cat = row.get(f'AFTER_{colname}')
-        before_present = 0 if pd.isnull(before_cat) or before_cat == "" else 1
-        after_present = 0 if pd.isnull(after_cat) or after_cat == "" else 1
-        b_cat = CATEGORY_RANK_MAP.get(before_cat, None) if before_present else None
-        a_cat = CATEGORY_RANK_MAP.get(after_cat, None) if after_present else None
-        key = (before_present, b_cat, after_present, a_cat)
-        result = category_compare_lookup.get(key)
-        return result["desc_ru"] if result else ""
-
-    for group, col in [
-        ('BANK',   'divisionRatings_BANK_ratingCategoryName'),
-        ('TB',     'divisionRatings_TB_ratingCategoryName'),
-        ('GOSB',   'divisionRatings_GOSB_ratingCategoryName'),
-    ]:
-        compare_df[f"{col}_Compare"] = compare_df.apply(lambda row: category_compare_enhanced(row, col), axis=1)
+            values = pd.DataFrame(columns=fields)
+        values = values.set_axis(pd.Index(kept), axis=0).reindex(index)
+        parts.append(values.add_prefix(prefix).reset_index(drop=True))
+    compare_df = pd.concat(parts, axis=1)
+    compare_df.index = key_index
+    compare_df = compare_df.reset_index()
+    if return_positions:
+        return compare_df, before_index, after_index
+    return compare_df
+
+
+def _compare_rows(df_before, df_after, category_transitions, unchanged_ids=None, keep_empty_dtypes=False):
+    """
+    Строки листа COMPARE без tournamentName и 'Итого': объединение BEFORE/AFTER, фильтр по
+    ALLOWED_TOURNAMENT_IDS, статусные колонки, фильтр строк без изменений, лучший уровень и описания.
+
+    Оба фильтра считаются масками сразу после объединения и статусов, поэтому лучший уровень и
+    описания строятся только для оставшихся строк (при заполненном NOCHANGE_STATUSES — только для изменений).
+
+    Returns:
+        (compare_df, before_index, after_index, allowed_count) — позиции исходных строк BEFORE и AFTER
+        для каждой строки результата (-1 — строки нет) и число строк после фильтра по турнирам.
+        keep_empty_dtypes — см. align_compare_frames.
+    """
+    compare_df, before_index, after_index = align_compare_frames(
+        df_before, df_after, COMPARE_KEYS, COMPARE_FIELDS, unchanged_ids, return_positions=True,
+        keep_empty_dtypes=keep_empty_dtypes)
+
+    # --- Фильтрация по tournamentId ---
+    if ALLOWED_TOURNAMENT_IDS:
+        allowed = compare_df['tournamentId'].isin(ALLOWED_TOURNAMENT_IDS).to_numpy()
+        if not allowed.all():
+            compare_df = compare_df[allowed].reset_index(drop=True)
+            before_index, after_index = before_index[allowed], after_index[allowed]
+    allowed_count = len(compare_df)
+
+    # Строки турниров без изменений: значения BEFORE и AFTER равны, сравнение не нужно
+    same = compare_df['tournamentId'].isin(unchanged_ids).to_numpy() if unchanged_ids else None
+
+    # indicatorValue_Compare: рост значения — рост индикатора
+    compare_df['indicatorValue_Compare'] = compare_values_status(compare_df, 'indicatorValue', (
+        STATUS_INDICATOR['val_add'], STATUS_INDICATOR['val_remove'], "",
+        STATUS_INDICATOR['val_nochange'], STATUS_INDICATOR['val_down'], STATUS_INDICATOR['val_up']), same)
+
+    # placeInRating_Compare: меньший номер места — лучше
+    for level, status_dict in [('BANK', STATUS_BANK_PLACE), ('TB', STATUS_TB_PLACE), ('GOSB', STATUS_GOSB_PLACE)]:
+        column = f'divisionRatings_{level}_placeInRating'
+        compare_df[f'{column}_Compare'] = compare_values_status(compare_df, column, (
+            status_dict['val_add'], status_dict['val_remove'], status_dict.get('val_norank', 'Нет места'),
+            status_dict['val_nochange'], status_dict['val_up'], status_dict['val_down']), same)
+
+    # === Сравнение категорий: одна выборка из таблицы переходов для BANK, TB и GOSB ===
+    category_cols = [f'divisionRatings_{level}_ratingCategoryName' for level in ('BANK', 'TB', 'GOSB')]
+    empty_codes = np.zeros(len(compare_df), dtype=np.int16)
+    before_codes = np.column_stack([
+        category_transitions.encode(compare_df[f'BEFORE_{col}']) if f'BEFORE_{col}' in compare_df.columns else empty_codes
+        for col in category_cols])
+    after_codes = np.column_stack([
+        category_transitions.encode(compare_df[f'AFTER_{col}']) if f'AFTER_{col}' in compare_df.columns else empty_codes
+        for col in category_cols])
+    category_statuses = category_transitions.compare(before_codes, after_codes)
+    for i, col in enumerate(category_cols):
+        compare_df[f"{col}_Compare"] = category_statuses[:, i]
+
+    # --- Фильтрация строк без изменений (по COMPARE_STATUS_COLUMNS, до построения производных колонок) ---
+    changed = ~nochange_rows_mask(compare_df)
+    if not changed.all():
+        compare_df = compare_df[changed].reset_index(drop=True)
+        before_index, after_index = before_index[changed], after_index[changed]
 
     # === Объединение статусов по приоритету BANK -> TB -> GOSB ===
     logging.info("Формирование объединенных статусов по лучшему доступному уровню...")
     
-    # Для placeInRating - с улучшенной защитой от ошибок
-    def safe_extract_place_result(row):
-        try:
-            result = select_best_status_and_level(row, "placeInRating")
-            if isinstance(result, tuple) and len(result) == 4:
-                return result
-            else:
-                logging.warning(f"Неожиданный результат select_best_status_and_level для placeInRating: {result}")
-                return (None, None, "Нет места", "BANK")
-        except Exception as e:
-            logging.warning(f"Ошибка в select_best_status_and_level для placeInRating: {e}")
-            return (None, None, "Нет места", "BANK")
-    
-    place_results = [safe_extract_place_result(row) for _, row in compare_df.iterrows()]
-    compare_df['BEFORE_placeInRating_Best'] = [str(res[0]) if res[0] is not None else None for res in place_results]
-    compare_df['AFTER_placeInRating_Best'] = [str(res[1]) if res[1] is not None else None for res in place_results]
-    compare_df['placeInRating_Compare_Best'] = [str(res[2]) for res in place_results]
-    compare_df['placeInRating_Level'] = [str(res[3]) for res in place_results]
-    
-    # Для ratingCategoryName - с улучшенной защитой от ошибок
-    def safe_extract_category_result(row):
-        try:
-            result = select_best_status_and_level(row, "ratingCategoryName")
-            if isinstance(result, tuple) and len(result) == 4:
-                return result
-            else:
-                logging.warning(f"Неожиданный результат select_best_status_and_level для ratingCategoryName: {result}")
-                return (None, None, "Нет призового значения", "BANK")
-        except Exception as e:
-            logging.warning(f"Ошибка в select_best_status_and_level для ratingCategoryName: {e}")
-            return (None, None, "Нет призового значения", "BANK")
-    
-    category_results = [safe_extract_category_result(row) for _, row in compare_df.iterrows()]
-    compare_df['BEFORE_ratingCategoryName_Best'] = [str(res[0]) if res[0] is not None else None for res in category_results]
-    compare_df['AFTER_ratingCategoryName_Best'] = [str(res[1]) if res[1] is not None else None for res in category_results]
-    compare_df['ratingCategoryName_Compare_Best'] = [str(res[2]) for res in category_results]
-    compare_df['ratingCategoryName_Level'] = [str(res[3]) for res in category_results]
+    # Для placeInRating и ratingCategoryName — выбор уровня масками по колонкам, без перебора строк
+    for field_type in ("placeInRating", "ratingCategoryName"):
+        before_best, after_best, status_best, level_best = select_best_status_and_level_columns(compare_df, field_type)
+        compare_df[f'BEFORE_{field_type}_Best'] = before_best
+        compare_df[f'AFTER_{field_type}_Best'] = after_best
+        compare_df[f'{field_type}_Compare_Best'] = status_best
+        compare_df[f'{field_type}_Level'] = level_best
     
     logging.info("Объединенные статусы сформированы")
 
     # Добавляем подробные описания статусов наград
-    compare_df['описание статуса награды подробное'] = compare_df['ratingCategoryName_Compare_Best'].apply(get_status_description)
+    compare_df['описание статуса награды подробное'] = status_descriptions(compare_df['ratingCategoryName_Compare_Best'])
     logging.info(LOG_MESSAGES["COMPARE_STATUS_DESCRIPTION_ADDED"])
 
     final_cols = COMPARE_KEYS + COMPARE_STATUS_COLUMNS + ['BEFORE_' + c for c in COMPARE_FIELDS] + ['AFTER_' + c for c in COMPARE_FIELDS]
@@ -964,36 +2860,141 @@ def make_compare_sheet(df_before, df_after, sheet_name, tid_to_fullname=None):
         'описание статуса награды подробное'
     ]
     compare_df = compare_df.reindex(columns=final_cols)
+    return compare_df, before_index, after_index, allowed_count
 
-    # --- Фильтрация по tournamentId ---
-    if ALLOWED_TOURNAMENT_IDS:
-        compare_df = compare_df[compare_df['tournamentId'].isin(ALLOWED_TOURNAMENT_IDS)]
-        logging.info(LOG_MESSAGES["COMPARE_SHEET_FILTERED"].format(count=len(compare_df)))
 
-    # --- Фильтрация строк без изменений ---
-    status_cols = COMPARE_STATUS_COLUMNS
+def _tournament_shards(df_before, df_after, shards):
+    """
+    Делит строки BEFORE и AFTER не более чем на shards частей по tournamentId: турнир целиком
+    попадает в одну часть, крупные турниры распределяются первыми в наименее загруженную часть.
 
-    def is_any_change(row):
-        for col in status_cols:
-            val = str(row.get(col, "")).strip()
-            if val not in NOCHANGE_STATUSES:
-                return True
-        return False
+    Returns:
+        список непустых частей (позиции строк BEFORE, позиции строк AFTER)
+    """
+    tournament_ids = pd.concat([df_before['tournamentId'], df_after['tournamentId']], ignore_index=True)
+    codes, uniques = pd.factorize(tournament_ids, use_na_sentinel=False)
+    sizes = np.bincount(codes, minlength=len(uniques))
+    shard_of = np.zeros(len(uniques), dtype=np.int64)
+    loads = [(0, shard) for shard in range(max(1, min(shards, len(uniques))))]
+    for tournament in np.argsort(-sizes, kind='stable'):
+        load, shard = heapq.heappop(loads)
+        shard_of[tournament] = shard
+        heapq.heappush(loads, (load + int(sizes[tournament]), shard))
+    row_shards = shard_of[codes]
+    before_shards, after_shards = row_shards[:len(df_before)], row_shards[len(df_before):]
+    parts = [(np.flatnonzero(before_shards == shard), np.flatnonzero(after_shards == shard))
+             for shard in range(len(loads))]
+    return [(before_rows, after_rows) for before_rows, after_rows in parts if len(before_rows) or len(after_rows)]
+
+
+def _compare_shard(df_before, df_after, category_transitions, unchanged_ids, log_level):
+    """
+    Задача процесса пула: _compare_rows для части турниров.
+    Возвращает (результат _compare_rows, записи лога, время в секундах, pid).
+    """
+    t_beg = datetime.now()
+    root = logging.getLogger()
+    saved_handlers, saved_level = root.handlers[:], root.level
+    collector = _LogRecordCollector()
+    root.handlers = [collector]
+    root.setLevel(log_level)
+    try:
+        # Пустая сторона части сохраняет типы: вся выгрузка не пуста, и join дал бы её типы
+        result = _compare_rows(df_before, df_after, category_transitions, unchanged_ids, keep_empty_dtypes=True)
+    finally:
+        root.handlers = saved_handlers
+        root.setLevel(saved_level)
+    return result, collector.records, (datetime.now() - t_beg).total_seconds(), os.getpid()
+
+
+def _shard_positions(rows, index):
+    """Позиции строк части (index, -1 — строки нет) в позиции исходной таблицы."""
+    positions = np.full(len(index), -1, dtype=np.int64)
+    present = index >= 0
+    positions[present] = rows[index[present]]
+    return positions
+
+
+def compare_rows_parallel(df_before, df_after, category_transitions, unchanged_ids=None):
+    """
+    _compare_rows по частям турниров (_tournament_shards) в пуле процессов.
+
+    Всё, что делает сравнение, считается внутри одного tournamentId, поэтому части независимы.
+    Результаты склеиваются в порядке последовательного сравнения — строки BEFORE по позиции,
+    затем новые строки AFTER по позиции, записи лога процессов выводятся по порядку частей.
+    При ошибке пула сравнение выполняется последовательно.
+
+    Returns:
+        то же, что _compare_rows
+    """
+    tournaments = pd.concat([df_before['tournamentId'], df_after['tournamentId']], ignore_index=True).nunique(dropna=False)
+    workers = min(PARALLEL_COMPARE_WORKERS or os.cpu_count() or 1, tournaments)
+    shards = _tournament_shards(df_before, df_after, workers * PARALLEL_COMPARE_SHARDS_PER_WORKER)
+    workers = min(workers, len(shards))
+    root = logging.getLogger()
+    log_level = max(root.level, min((h.level for h in root.handlers), default=root.level))
+    logging.info(LOG_MESSAGES["PARALLEL_COMPARE_START"].format(
+        tournaments=tournaments, shards=len(shards), workers=workers))
+
+    t_beg = datetime.now()
+    try:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            futures = [pool.submit(_compare_shard, df_before.iloc[before_rows], df_after.iloc[after_rows],
+                                   category_transitions, unchanged_ids, log_level)
+                       for before_rows, after_rows in shards]
+            results = [future.result() for future in futures]
+    except Exception as ex:
+        logging.warning(LOG_MESSAGES["PARALLEL_COMPARE_FALLBACK"].format(ex=ex))
+        return _compare_rows(df_before, df_after, category_transitions, unchanged_ids)
+
+    frames, before_parts, after_parts, allowed_count = [], [], [], 0
+    for shard, ((before_rows, after_rows), (part, records, seconds, pid)) in enumerate(zip(shards, results), 1):
+        for record in records:
+            root.handle(record)
+        part_df, part_before, part_after, part_allowed = part
+        logging.info(LOG_MESSAGES["PARALLEL_COMPARE_WORKER_DONE"].format(
+            shard=shard, shards=len(shards), rows=len(part_df), seconds=seconds, pid=pid))
+        allowed_count += part_allowed
+        # Пустые части не участвуют в склейке, чтобы не влиять на типы колонок
+        if len(part_df) or not frames:
+            frames.append(part_df)
+            before_parts.append(_shard_positions(before_rows, part_before))
+            after_parts.append(_shard_positions(after_rows, part_after))
+    if len(frames) > 1 and not len(frames[0]):
+        frames, before_parts, after_parts = frames[1:], before_parts[1:], after_parts[1:]
+    before_index, after_index = np.concatenate(before_parts), np.concatenate(after_parts)
+    order = np.argsort(np.where(before_index >= 0, before_index, len(df_before) + after_index), kind='stable')
+    compare_df = pd.concat(frames, ignore_index=True) if len(frames) > 1 else frames[0]
+    compare_df = compare_df.take(order).reset_index(drop=True)
+    logging.info(LOG_MESSAGES["PARALLEL_COMPARE_DONE"].format(
+        rows=len(compare_df), seconds=(datetime.now() - t_beg).total_seconds()))
+    return compare_df, before_index[order], after_index[order], allowed_count
+
+
+def make_compare_sheet(df_before, df_after, sheet_name, tid_to_fullname=None, category_transitions=None,
+                       unchanged_ids=None):
+    logging.info(LOG_MESSAGES["COMPARE_SHEET_START"])
+    if category_transitions is None:
+        category_transitions = CategoryTransitions()
+
+    # Части по турнирам сравниваются в пуле процессов, если есть что делить
+    parallel = (PARALLEL_COMPARE and len(df_before) and len(df_after)
+                and pd.concat([df_before['tournamentId'], df_after['tournamentId']]).nunique(dropna=False) > 1)
+    compare_rows = compare_rows_parallel if parallel else _compare_rows
+    compare_df, _, _, allowed_count = compare_rows(df_before, df_after, category_transitions, unchanged_ids)
+    if ALLOWED_TOURNAMENT_IDS:
+        logging.info(LOG_MESSAGES["COMPARE_SHEET_FILTERED"].format(count=allowed_count))
 
-    compare_df = compare_df[compare_df.apply(is_any_change, axis=1)].reset_index(drop=True)
-    
     # Добавляем tournamentName если передан маппинг
     if tid_to_fullname:
         compare_df['tournamentName'] = compare_df['tournamentId'].map(tid_to_fullname)
     
-    # Добавляем итоговую колонку с описанием изменений
-    # Используем tournamentName напрямую из строки
-    def create_summary_for_row(row):
-        tournament_name = row.get('tournamentName', '')
-        return create_summary_row(row, tournament_name)
-    
-    compare_df['Итого'] = compare_df.apply(create_summary_for_row, axis=1)
-    logging.info(LOG_MESSAGES["COMPARE_SUMMARY_ADDED"])
+    # Добавляем итоговую колонку с описанием изменений (при COMPARE_SUMMARY_LAZY — только при экспорте)
+    if COMPARE_SUMMARY_LAZY:
+        logging.info(LOG_MESSAGES["COMPARE_SUMMARY_DEFERRED"])
+    else:
+        compare_df['Итого'] = build_compare_summary(compare_df)
+        logging.info(LOG_MESSAGES["COMPARE_SUMMARY_ADDED"])
     
     logging.info(LOG_MESSAGES["COMPARE_SHEET_FINAL"].format(count=len(compare_df)))
     return compare_df, sheet_name
@@ -1083,63 +3084,182 @@ def add_status_legend(writer, legend_data, sheet_name=SHEET_NAMES['status_legend
 
 
 
-def build_final_sheet_fast(compare_df, allowed_ids, out_prefix, category_rank_map, df_before, df_after, log, sheet_name="FINAL"):
-    """Строит итоговый лист по всем турнирам и сотрудникам. Оптимизированная версия: lookup-структуры вместо фильтрации."""
-    log.info(LOG_MESSAGES["FINAL_BUILD_START"])
-    if allowed_ids:
-        tournaments = list(allowed_ids)
-    else:
-        tournaments = sorted(compare_df['tournamentId'].dropna().unique())
-
-    emp_cols = ['employeeNumber', 'lastName', 'firstName']
-    employees = compare_df[emp_cols].drop_duplicates().sort_values(emp_cols)
-    log.info(LOG_MESSAGES["FINAL_UNIQUE_EMPLOYEES"].format(num_employees=len(employees)))
-    total_loops = len(employees) * len(tournaments)
-    log.info(LOG_MESSAGES["FINAL_TOTAL_LOOPS"].format(loops=total_loops))
-
-    # --- Быстрый доступ по сотруднику+турнир (tuple index)
-    indexed = compare_df.set_index(['employeeNumber', 'lastName', 'firstName', 'tournamentId'])
-    # --- Быстрый доступ к признаку "был ли в before/after"
-    before_pairs = set(zip(df_before['employeeNumber'], df_before['tournamentId']))
-    after_pairs = set(zip(df_after['employeeNumber'], df_after['tournamentId']))
-
-    # Теперь используем объединенный статус категорий
-    best_status_col = 'ratingCategoryName_Compare_Best'
-
-    result_rows = []
-    status_counter = {t_id: {} for t_id in tournaments}
+class FinalStatusCodes:
+    """
+    Словарь статусов итоговых листов: статус <-> целочисленный код.
 
-    for emp_idx, (_, emp) in enumerate(employees.iterrows(), 1):
-        emp_key = (emp['employeeNumber'], emp['lastName'], emp['firstName'])
-        row = {col: emp[col] for col in emp_cols}
+    Начальные коды — FINAL_STATUS_LIST, FINAL_PLACE_STATUS_LIST и статусы STATUS_COLORS_DICT;
+    значения, которых нет в словаре, получают следующие коды при encode. Пока статусов не больше 256,
+    матрицы кодов хранятся в uint8.
+    """
 
-        for t_id in tournaments:
-            idx = emp_key + (t_id,)
-            best_val = None
+    def __init__(self, statuses=None):
+        if statuses is None:
+            statuses = FINAL_STATUS_LIST + FINAL_PLACE_STATUS_LIST + list(STATUS_COLORS_DICT)
+        self.values = list(dict.fromkeys(statuses))
+        self.codes = {value: code for code, value in enumerate(self.values)}
+        self._category_dtype = None
+
+    @property
+    def dtype(self):
+        return np.uint8 if len(self.values) <= 256 else np.uint16
+
+    def encode(self, values):
+        """Коды значений (новые значения добавляются в словарь)."""
+        result = np.empty(len(values), dtype=np.int64)
+        for i, value in enumerate(values):
+            code = self.codes.get(value)
+            if code is None:
+                code = self.codes[value] = len(self.values)
+                self.values.append(value)
+            result[i] = code
+        return result
+
+    def decode(self, codes):
+        """Значения по кодам (np.ndarray[object])."""
+        return np.array(self.values, dtype=object)[codes]
+
+    def column(self, codes):
+        """
+        Колонка листа из кодов: pandas category с категориями словаря. Вторым значением
+        возвращается тип, который получила бы колонка из строк, — для restore_frame_dtypes.
+        """
+        # Один CategoricalDtype на все колонки, пока словарь не пополнялся
+        if self._category_dtype is None or len(self._category_dtype.categories) != len(self.values):
+            self._category_dtype = pd.CategoricalDtype(pd.Index(self.values, dtype=object))
+        categories = self._category_dtype.categories
+        used = np.bincount(codes, minlength=len(self.values)) > 0
+        dtype = pd.Series(categories[used].tolist()).dtype if used.any() else np.dtype(object)
+        return pd.Categorical.from_codes(codes.astype(np.int64), dtype=self._category_dtype), dtype
+
+
+class FinalGrid:
+    """
+    Общая сетка сотрудник × турнир для листов FINAL и FINAL_PLACE.
 
-            subset = indexed.loc[idx] if idx in indexed.index else None
-            if subset is not None:
-                # Используем объединенный статус, который уже выбран по приоритету BANK->TB->GOSB
-                val = subset.get(best_status_col)
-                if pd.notnull(val) and str(val).strip() not in ['', 'Нет призового значения', 'Не участвовал']:
-                    best_val = val
+    Сотрудники (drop_duplicates + sort_values), турниры, признак участия по df_before/df_after
+    и позиции строк сравнения в сетке считаются один раз; матрицы кодов статусов для обоих листов
+    (общий словарь FinalStatusCodes) затем заполняются из них одной записью по индексам (status_matrix).
+    """
+    EMP_COLS = ['employeeNumber', 'lastName', 'firstName']
 
-            was_in_before = (emp['employeeNumber'], t_id) in before_pairs
-            was_in_after = (emp['employeeNumber'], t_id) in after_pairs
+    def __init__(self, compare_df, allowed_ids, df_before, df_after, codes=None):
+        self.codes = codes if codes is not None else FinalStatusCodes()
+        if allowed_ids:
+            self.tournaments = list(allowed_ids)
+        else:
+            self.tournaments = sorted(compare_df['tournamentId'].dropna().unique())
+        # Колонки листа — турниры без повторов
+        self.columns = list(dict.fromkeys(self.tournaments))
+        self.employees = compare_df[self.EMP_COLS].drop_duplicates().sort_values(self.EMP_COLS)
+        self.compare_df = compare_df
+        tournament_index = pd.Index(self.columns)
+        n_employees, n_columns = len(self.employees), len(self.columns)
+
+        # Участие: пары (employeeNumber, tournamentId) из BEFORE и AFTER — одна булева матрица по номерам сотрудников
+        self.participated = np.zeros((n_employees, n_columns), dtype=bool)
+        # Позиции строк сравнения в сетке (-1 — строки нет на листе)
+        self.rows = np.full(len(compare_df), -1, dtype=np.intp)
+        self.cols = np.full(len(compare_df), -1, dtype=np.intp)
+        if not n_employees or not n_columns:
+            return
+        pair_tournaments = tournament_index.get_indexer(
+            pd.concat([df_before['tournamentId'], df_after['tournamentId']], ignore_index=True))
+        number_codes, numbers = pd.factorize(pd.concat(
+            [self.employees['employeeNumber'], df_before['employeeNumber'], df_after['employeeNumber']],
+            ignore_index=True), use_na_sentinel=False)
+        employee_numbers, pair_numbers = number_codes[:n_employees], number_codes[n_employees:]
+        known = pair_tournaments >= 0
+        by_number = np.zeros((len(numbers), n_columns), dtype=bool)
+        by_number[pair_numbers[known], pair_tournaments[known]] = True
+        self.participated = by_number[employee_numbers]
+
+        employee_keys, compare_keys = factorize_compare_keys([self.employees, compare_df], self.EMP_COLS)
+        self.rows = pd.Index(employee_keys).get_indexer(compare_keys)
+        self.cols = tournament_index.get_indexer(compare_df['tournamentId'])
+
+    def status_matrix(self, status_col, empty_values, participated_value, absent_value="Не участвовал"):
+        """
+        Матрица кодов листа (словарь self.codes): по умолчанию absent_value, для участников —
+        participated_value, поверх — статусы status_col из сравнения, кроме empty_values
+        (сравниваются после str().strip()).
+
+        Returns:
+            np.ndarray формы (сотрудники, турниры) с типом self.codes.dtype; после decode — те же
+            значения, что давал перебор сотрудников и турниров с поиском по MultiIndex и множествам пар.
+        """
+        absent_code, participated_code = self.codes.encode([absent_value, participated_value])
+        values = None
+        if status_col in self.compare_df.columns and self.participated.size:
+            values = self.compare_df[status_col].to_numpy(dtype=object)
+            value_codes, uniques = pd.factorize(values)
+            empty = set(empty_values)
+            unique_valid = np.array([str(value).strip() not in empty for value in uniques], dtype=bool)
+            # Коды словаря — только для статусов, которые попадут в ячейки
+            unique_codes = np.zeros(len(uniques), dtype=np.int64)
+            unique_codes[unique_valid] = self.codes.encode(uniques[unique_valid])
+        matrix = np.full(self.participated.shape, absent_code, dtype=self.codes.dtype)
+        matrix[self.participated] = participated_code
+        if values is None:
+            return matrix
+        valid = unique_valid[value_codes] if len(uniques) else np.zeros(len(values), dtype=bool)
+        valid[value_codes < 0] = False
+        valid &= (self.rows >= 0) & (self.cols >= 0)
+        matrix[self.rows[valid], self.cols[valid]] = unique_codes[value_codes[valid]]
+        return matrix
+
+
+def final_status_counts(matrix, tournaments, codes):
+    """Число ячеек каждого статуса по колонкам матрицы кодов: {tournamentId: {статус: число}} в порядке появления."""
+    counts = {}
+    for j, t_id in enumerate(tournaments):
+        column = matrix[:, j]
+        totals = np.bincount(column)
+        present = np.flatnonzero(totals)
+        present = present[np.argsort([np.argmax(column == code) for code in present], kind='stable')]
+        counts[t_id] = dict(zip(codes.decode(present).tolist(), totals[present].tolist()))
+    return counts
+
+
+def final_matrix_frame(employees, emp_cols, tournaments, matrix, codes):
+    """
+    Лист из сотрудников и матрицы кодов (колонки — emp_cols, затем турниры). Колонки турниров
+    остаются кодами (category), исходный строковый тип записан в attrs['compact_dtypes'] —
+    строки восстанавливаются только при выгрузке (restore_frame_dtypes).
+    """
+    if not len(employees):
+        return pd.DataFrame()
+    data = {col: employees[col].tolist() for col in emp_cols}
+    plan = {}
+    for j, t_id in enumerate(tournaments):
+        data[t_id], dtype = codes.column(matrix[:, j])
+        plan[t_id] = (dtype, None)
+    df = pd.DataFrame(data)
+    if plan:
+        df.attrs['compact_dtypes'] = plan
+    return df
 
-            if best_val is not None:
-                final_value = best_val
-            elif was_in_before or was_in_after:
-                final_value = "Нет призового значения"
-            else:
-                final_value = "Не участвовал"
 
-            status_counter[t_id][final_value] = status_counter[t_id].get(final_value, 0) + 1
+def build_final_sheet_fast(compare_df, allowed_ids, out_prefix, category_rank_map, df_before, df_after, log, sheet_name="FINAL",
+                           grid=None):
+    """
+    Строит итоговый лист по всем турнирам и сотрудникам. Матрица сотрудник × турнир
+    собирается целиком по сетке FinalGrid (её можно передать готовой — общей с FINAL_PLACE).
+    """
+    log.info(LOG_MESSAGES["FINAL_BUILD_START"])
+    if grid is None:
+        grid = FinalGrid(compare_df, allowed_ids, df_before, df_after)
+    tournaments = grid.tournaments
+    log.info(LOG_MESSAGES["FINAL_UNIQUE_EMPLOYEES"].format(num_employees=len(grid.employees)))
+    total_loops = len(grid.employees) * len(tournaments)
+    log.info(LOG_MESSAGES["FINAL_TOTAL_LOOPS"].format(loops=total_loops))
 
-            row[t_id] = final_value
-        result_rows.append(row)
+    # Используем объединенный статус категорий (уже выбран по приоритету BANK->TB->GOSB)
+    matrix = grid.status_matrix(
+        'ratingCategoryName_Compare_Best', ('', 'Нет призового значения', 'Не участвовал'), "Нет призового значения")
+    status_counter = final_status_counts(matrix, grid.columns, grid.codes)
 
-    final_df = pd.DataFrame(result_rows)
+    final_df = final_matrix_frame(grid.employees, grid.EMP_COLS, grid.columns, matrix, grid.codes)
     log.info(LOG_MESSAGES["FINAL_TABLE_DONE"].format(shape=f"{final_df.shape[0]} x {final_df.shape[1]}"))
     # Подробное логирование по каждому турниру
     for t_id in tournaments:
@@ -1209,66 +3329,47 @@ def format_compare_dataframe(compare_df, export_columns):
     return compare_df[columns_present + extra_cols]
 
 
+def add_compare_summary_for_export(compare_df, export_columns):
+    """
+    Добавляет колонку 'Итого' при экспорте (COMPARE_SUMMARY_LAZY) на то место,
+    которое она заняла бы после format_compare_dataframe. Если колонка уже есть, таблица не меняется.
+    """
+    if 'Итого' in compare_df.columns:
+        return compare_df
+    compare_df = compare_df.copy(deep=False)
+    if 'Итого' in export_columns:
+        preceding = set(export_columns[:export_columns.index('Итого')])
+        if 'tournamentId' in preceding:
+            preceding.add('tournamentName')
+        position = sum(1 for col in compare_df.columns if col in preceding)
+    else:
+        position = len(compare_df.columns)
+    compare_df.insert(position, 'Итого', build_compare_summary(compare_df))
+    logging.info(LOG_MESSAGES["COMPARE_SUMMARY_ADDED"])
+    return compare_df
+
+
 
-def build_final_place_sheet_from_compare(compare_df, allowed_ids, df_before, df_after, log, sheet_name="FINAL_PLACE"):
+def build_final_place_sheet_from_compare(compare_df, allowed_ids, df_before, df_after, log, sheet_name="FINAL_PLACE",
+                                         grid=None):
     """
     Строит сводную таблицу по статусам placeInRating_Compare (BANK > TB > GOSB > Не участвовал).
     Подсчёт статусов идёт только по одному выбранному для турнира уровню, без дублей.
+    Сетка сотрудник × турнир — FinalGrid (общая с FINAL, если передана).
     """
     log.info(LOG_MESSAGES["PLACE_BUILD_START"].format(sheet=sheet_name))
-    if allowed_ids:
-        tournaments = list(allowed_ids)
-    else:
-        tournaments = sorted(compare_df['tournamentId'].dropna().unique())
-
-    emp_cols = ['employeeNumber', 'lastName', 'firstName']
-    employees = compare_df[emp_cols].drop_duplicates().sort_values(emp_cols)
-    log.info(LOG_MESSAGES["PLACE_UNIQUE_EMPLOYEES"].format(sheet=sheet_name, num_employees=len(employees)))
+    if grid is None:
+        grid = FinalGrid(compare_df, allowed_ids, df_before, df_after)
+    tournaments = grid.tournaments
+    log.info(LOG_MESSAGES["PLACE_UNIQUE_EMPLOYEES"].format(sheet=sheet_name, num_employees=len(grid.employees)))
     log.info(LOG_MESSAGES["PLACE_TOURNAMENTS"].format(sheet=sheet_name, num_tournaments=len(tournaments)))
 
     # Теперь используем объединенный статус места
-    best_place_col = 'placeInRating_Compare_Best'
-
-    # Быстрые индексы
-    indexed = compare_df.set_index(['employeeNumber', 'lastName', 'firstName', 'tournamentId'])
-    before_pairs = set(zip(df_before['employeeNumber'], df_before['tournamentId']))
-    after_pairs = set(zip(df_after['employeeNumber'], df_after['tournamentId']))
-
-    result_rows = []
-    status_counter = {t_id: {} for t_id in tournaments}
-
-    # Строим по объединенному статусу мест
-    for _, emp in employees.iterrows():
-        emp_key = (emp['employeeNumber'], emp['lastName'], emp['firstName'])
-        row = {col: emp[col] for col in emp_cols}
-
-        for t_id in tournaments:
-            idx = emp_key + (t_id,)
-            value = None
-            
-            if idx in indexed.index:
-                rec = indexed.loc[idx]
-                # Используем объединенный статус, который уже выбран по приоритету BANK->TB->GOSB
-                v = rec.get(best_place_col, None)
-                if pd.notnull(v) and str(v).strip() not in ['', 'Нет места', 'Нет значения ранга', 'Не участвовал']:
-                    value = v
-
-            was_in_before = (emp['employeeNumber'], t_id) in before_pairs
-            was_in_after = (emp['employeeNumber'], t_id) in after_pairs
-
-            if value is not None:
-                final_value = value
-            elif was_in_before or was_in_after:
-                final_value = "Нет значения ранга"
-            else:
-                final_value = "Не участвовал"
-
-            row[t_id] = final_value
-            status_counter[t_id][final_value] = status_counter[t_id].get(final_value, 0) + 1
-
-        result_rows.append(row)
+    matrix = grid.status_matrix(
+        'placeInRating_Compare_Best', ('', 'Нет места', 'Нет значения ранга', 'Не участвовал'), "Нет значения ранга")
+    status_counter = final_status_counts(matrix, grid.columns, grid.codes)
 
-    final_place_df = pd.DataFrame(result_rows)
+    final_place_df = final_matrix_frame(grid.employees, grid.EMP_COLS, grid.columns, matrix, grid.codes)
     log.info(LOG_MESSAGES["PLACE_TABLE_DONE"].format(sheet=sheet_name, shape=f"{final_place_df.shape[0]} x {final_place_df.shape[1]}"))
 
     # Логирование по турнирам
@@ -1277,7 +3378,6 @@ def build_final_place_sheet_from_compare(compare_df, allowed_ids, df_before, df_
         for status, count in status_counter[t_id].items():
             log.debug(LOG_MESSAGES["PLACE_TOURN_STATUS_ROW"].format(sheet=sheet_name, status=status, count=count))
 
-    # Дополнительно: вернуть структуру tournament_level если потребуется для диагностики
     return final_place_df, tournaments
 
 def apply_stat_grp_conditional_formatting(writer, sheet_name, stat_prefixes=('stat_', 'grp_'), log=None):
@@ -1315,9 +3415,67 @@ def apply_stat_grp_conditional_formatting(writer, sheet_name, stat_prefixes=('st
     if log:
         log.info(LOG_MESSAGES["COND_FMT_FINISH"].format(sheet=sheet_name, prefixes=stat_prefixes))
 
+def status_count_matrix(df, status_cols, stat_names):
+    """
+    Число вхождений каждого статуса из stat_names по колонкам status_cols в каждой строке.
+
+    Returns:
+        np.ndarray[int64] формы (len(df), len(stat_names)); колонка, указанная в status_cols
+        дважды, считается дважды, отсутствующие колонки пропускаются.
+    """
+    size = len(df) * len(stat_names)
+    if not size:
+        return np.zeros((len(df), len(stat_names)), dtype=np.int64)
+    stat_index = pd.Index(stat_names)
+    offsets = np.arange(len(df), dtype=np.int64) * len(stat_names)
+    counts = np.zeros(size, dtype=np.int64)
+    for col in status_cols:
+        if col not in df.columns:
+            continue
+        series = df[col]
+        if isinstance(series.dtype, pd.CategoricalDtype):
+            # Колонки кодов (FINAL/FINAL_PLACE): статус сопоставляется один раз на категорию
+            category_codes = np.append(stat_index.get_indexer(series.cat.categories), -1)
+            codes = category_codes[series.cat.codes.to_numpy()]
+        else:
+            codes = stat_index.get_indexer(series.to_numpy(dtype=object))
+        found = codes >= 0
+        counts += np.bincount(offsets[found] + codes[found], minlength=size)
+    return counts.reshape(len(df), len(stat_names))
+
+
+def top_status_labels(counts, stat_names, top_n=3):
+    """
+    TOP-1..top_n по матрице счётчиков: для k-го по величине положительного значения в строке —
+    названия всех статусов с этим значением через ', ' (в порядке stat_names), иначе '-'.
+    """
+    tops = [np.full(len(counts), '-', dtype=object) for _ in range(top_n)]
+    if not counts.size:
+        return tops
+    # Битовые маски до 62 статусов помещаются в int64, иначе — целые Python
+    weight_dtype = np.int64 if len(stat_names) < 63 else object
+    weights = np.left_shift(1, np.arange(len(stat_names), dtype=weight_dtype))
+    bound = np.full(len(counts), np.iinfo(np.int64).max, dtype=np.int64)
+    for top in tops:
+        level = np.where(counts < bound[:, None], counts, 0).max(axis=1)
+        present = level > 0
+        if not present.any():
+            break
+        # Набор статусов уровня кодируется битовой маской — строка склеивается один раз на набор
+        members = (counts == level[:, None]) & present[:, None]
+        keys, inverse = np.unique(members.astype(weight_dtype) @ weights, return_inverse=True)
+        labels = np.array([
+            ', '.join(name for i, name in enumerate(stat_names) if (key >> i) & 1) or '-' for key in keys
+        ], dtype=object)
+        top[:] = labels[inverse.reshape(-1)]
+        bound = np.where(present, level, bound)
+    return tops
+
+
 def add_status_count_and_top3(df, status_cols, all_statuses, log, is_final_place=False):
     """
     Добавляет к DataFrame счетчики по статусам, top-3 (названия), и (для FINAL) — группы.
+    Счётчики — одна матрица строка × статус (status_count_matrix), TOP и группы считаются по ней.
     """
     exclude = {"Не участвовал", "Нет призового значения", "Остался вне призеров"}
     stat_names = [s for s in all_statuses if s not in exclude]
@@ -1329,58 +3487,41 @@ def add_status_count_and_top3(df, status_cols, all_statuses, log, is_final_place
     if not is_final_place:
         new_columns += group_cols + ['GRP_MAX']
 
-    result_rows = []
-    for idx, row in df.iterrows():
-        stats = {s: 0 for s in stat_names}
-        vals = [row.get(c, None) for c in status_cols]
-        for v in vals:
-            if v in stats:
-                stats[v] += 1
-        # TOP-3
-        stat_items = sorted(stats.items(), key=lambda x: (-x[1], stat_names.index(x[0])))
-        used_names = set()
-        tops = []
-        items_left = stat_items.copy()
-        for _ in range(3):
-            if not items_left or items_left[0][1] <= 0:
-                tops.append('-')
-                continue
-            maxval = items_left[0][1]
-            names = [n for n, cnt in items_left if cnt == maxval]
-            tops.append(', '.join(names))
-            used_names.update(names)
-            items_left = [(n, cnt if n not in names else -1) for n, cnt in items_left]
-            items_left = sorted(items_left, key=lambda x: (-x[1], stat_names.index(x[0])))
-
-        # Подсчет по группам
-        group_counts = []
-        grp_max = "-"
-        if not is_final_place:
-            max_val = 0
-            for gname, gstatuses in STATUS_GROUPS:
-                cnt = sum(stats.get(s, 0) for s in gstatuses)
-                group_counts.append(cnt)
-                if cnt > max_val:
-                    max_val = cnt
-            max_groups = [group_names[i] for i, val in enumerate(group_counts) if val == max_val and val > 0]
-            if max_groups:
-                # Выбираем только первую по приоритету (обычно это Группа 1, если она есть)
-                best_group = max_groups[0]
-                grp_max = f"({best_group}) {GROUP_DESC_DICT[best_group]}"
-            else:
-                grp_max = "-"
-
-        new_row = list(row.values)
-        new_row += [stats[s] for s in stat_names]
-        new_row += tops
+    if not len(df):
+        result_df = pd.DataFrame([], columns=new_columns)
+    else:
+        counts = status_count_matrix(df, status_cols, stat_names)
+        # Колонки кодов статусов переносятся без раскодирования
+        data = {col: (df[col].array if isinstance(df[col].dtype, pd.CategoricalDtype) else df[col].tolist())
+                for col in df.columns}
+        for j, col in enumerate(stat_cols):
+            data[col] = counts[:, j].tolist()
+        for col, top in zip(['TOP1', 'TOP2', 'TOP3'], top_status_labels(counts, stat_names)):
+            data[col] = top.tolist()
+
+        # Подсчет по группам: статусы вне stat_names в группах не учитываются
         if not is_final_place:
-            new_row += group_counts
-            new_row += [grp_max]
-        result_rows.append(new_row)
+            stat_position = {s: i for i, s in enumerate(stat_names)}
+            membership = np.zeros((len(stat_names), len(group_names)), dtype=np.int64)
+            for g, (_, gstatuses) in enumerate(STATUS_GROUPS):
+                for status in gstatuses:
+                    if status in stat_position:
+                        membership[stat_position[status], g] += 1
+            group_counts = counts @ membership
+            for g, col in enumerate(group_cols):
+                data[col] = group_counts[:, g].tolist()
+            # Выбираем только первую по приоритету группу с максимумом (обычно это Группа 1, если она есть)
+            labels = np.array([f"({g}) {GROUP_DESC_DICT[g]}" for g in group_names] + ["-"], dtype=object)
+            best = group_counts.argmax(axis=1) if group_names else np.zeros(len(df), dtype=np.intp)
+            has_max = group_counts.max(axis=1) > 0 if group_names else np.zeros(len(df), dtype=bool)
+            data['GRP_MAX'] = labels[np.where(has_max, best, len(group_names))].tolist()
+        result_df = pd.DataFrame(data, columns=new_columns)
+        if 'compact_dtypes' in df.attrs:
+            result_df.attrs['compact_dtypes'] = dict(df.attrs['compact_dtypes'])
     log.info(LOG_MESSAGES["ADD_STATUSES_SUMMARY"].format(
         columns=stat_cols + ['TOP1', 'TOP2', 'TOP3'] + (group_cols + ['GRP_MAX'] if not is_final_place else [])
     ))
-    return pd.DataFrame(result_rows, columns=new_columns), stat_names, group_cols
+    return result_df, stat_names, group_cols
 
 
 def export_and_log(writer, df, sheet_name, log, freeze_map=None):
@@ -1412,47 +3553,45 @@ def get_group_distribution(df, group_cols):
             result[col] = int(df[col].sum())
     return result
 
-def main():
-    """Основная точка входа в программу."""
-    logger = setup_logger(LOG_DIR, LOG_BASENAME)
-
-    # === Загрузка справочников и подготовка соответствия TournamentID → FULL_NAME ===
-    tid_to_fullname = build_tournament_fullname_map(
-        CATALOG_DIR, TOURNAMENT_SCHEDULE_CSV, CONTEST_DATA_CSV
-    )
-    logger.info(LOG_MESSAGES["MAIN_TOURNAMENT_DESCRIPTIONS_LOADED"].format(count=len(tid_to_fullname)))
+def load_snapshot(path, label, tid_to_fullname, tournament_filter, log, preloaded=None):
+    """
+    Загрузка одной выгрузки для сравнения: разбор JSON, tournamentName, контрольные суммы турниров,
+    компактное хранение и фильтр турниров для листов BEFORE/AFTER.
 
-    t_start = datetime.now()
-    now = datetime.now()
-    ts = now.strftime("%Y%m%d_%H%M%S")
+    Args:
+        path: путь к JSON-выгрузке
+        label: название выгрузки для лога (имя листа или файла)
+        preloaded: (df, seconds) — таблица, уже разобранная параллельной загрузкой
 
-    # --- Загрузка данных ---
-    logger.info(LOG_MESSAGES["MAIN_BEFORE_READ"].format(sheet=SHEET_NAMES['before'], path=os.path.join(SOURCE_DIR, BEFORE_FILENAME)))
-    t_beg_before = datetime.now()
-    rows_before = process_json_file(os.path.join(SOURCE_DIR, BEFORE_FILENAME))
-    df_before = pd.DataFrame(rows_before)
-    df_before['tournamentName'] = df_before['tournamentId'].map(tid_to_fullname)
-    t_end_before = datetime.now()
-    logger.info(LOG_MESSAGES["MAIN_BEFORE_LOADED"].format(count=len(df_before), sheet=SHEET_NAMES['before']))
-    log_data_stats(df_before, SHEET_NAMES['before'])
-
-    logger.info(LOG_MESSAGES["MAIN_AFTER_READ"].format(sheet=SHEET_NAMES['after'], path=os.path.join(SOURCE_DIR, AFTER_FILENAME)))
-    t_beg_after = datetime.now()
-    rows_after = process_json_file(os.path.join(SOURCE_DIR, AFTER_FILENAME))
-    df_after = pd.DataFrame(rows_after)
-    df_after['tournamentName'] = df_after['tournamentId'].map(tid_to_fullname)
-    t_end_after = datetime.now()
-    logger.info(LOG_MESSAGES["MAIN_AFTER_LOADED"].format(count=len(df_after), sheet=SHEET_NAMES['after']))
-    log_data_stats(df_after, SHEET_NAMES['after'])
-
-    # --- Фильтрация турниров для листов BEFORE и AFTER (при необходимости) ---
-    df_before = filter_dataframe_by_tournaments(
-        df_before, ALLOWED_TOURNAMENT_IDS, FILTER_TOURNAMENTS_IN_BEFORE_AFTER, SHEET_NAMES['before']
-    )
-    df_after = filter_dataframe_by_tournaments(
-        df_after, ALLOWED_TOURNAMENT_IDS, FILTER_TOURNAMENTS_IN_BEFORE_AFTER, SHEET_NAMES['after']
-    )
+    Returns:
+        (df, digests, seconds) — digests пустой при COMPARE_SKIP_UNCHANGED_TOURNAMENTS = False,
+        seconds — время загрузки без фильтра турниров
+    """
+    log.info(LOG_MESSAGES["MAIN_SNAPSHOT_READ"].format(sheet=label, path=path))
+    t_beg = datetime.now()
+    if preloaded is not None:
+        df, seconds = preloaded
+    else:
+        df, seconds = process_json_file_cached(path, tournament_filter), 0.0
+    df['tournamentName'] = df['tournamentId'].map(tid_to_fullname)
+    digests = tournament_digests(df, label) if COMPARE_SKIP_UNCHANGED_TOURNAMENTS else {}
+    df = compact_frame(df, label)
+    seconds += (datetime.now() - t_beg).total_seconds()
+    log.info(LOG_MESSAGES["MAIN_SNAPSHOT_LOADED"].format(count=len(df), sheet=label))
+    log_data_stats(df, label)
+    # Фильтрация турниров для листов BEFORE и AFTER (при необходимости)
+    df = filter_dataframe_by_tournaments(df, ALLOWED_TOURNAMENT_IDS, FILTER_TOURNAMENTS_IN_BEFORE_AFTER, label)
+    return df, digests, seconds
+
+
+def compare_snapshots(df_before, df_after, before_digests, after_digests, tid_to_fullname, category_transitions, log):
+    """
+    Сравнение двух загруженных выгрузок (см. load_snapshot): COMPARE, FINAL, FINAL_PLACE,
+    TOP-3 и распределения статусов. Входные таблицы не изменяются.
 
+    Returns:
+        словарь с таблицами для export_compare_workbook и данными для log_compare_summary
+    """
     # --- Анализ турниров ---
     before_tids = set(df_before['tournamentId'].unique())
     after_tids = set(df_after['tournamentId'].unique())
@@ -1460,15 +3599,15 @@ def main():
     removed_tids = before_tids - after_tids
     common_tids = before_tids & after_tids
 
-    logger.info(LOG_MESSAGES["MAIN_TOURNAMENTS_INFO"].format(
+    log.info(LOG_MESSAGES["MAIN_TOURNAMENTS_INFO"].format(
         sheet_before=SHEET_NAMES['before'], before_count=len(before_tids),
         sheet_after=SHEET_NAMES['after'], after_count=len(after_tids)
     ))
-    logger.info(LOG_MESSAGES["MAIN_TOURNAMENTS_NEW"].format(
+    log.info(LOG_MESSAGES["MAIN_TOURNAMENTS_NEW"].format(
         sheet_after=SHEET_NAMES['after'], count=len(added_tids), ids=list(added_tids)))
-    logger.info(LOG_MESSAGES["MAIN_TOURNAMENTS_REMOVED"].format(
+    log.info(LOG_MESSAGES["MAIN_TOURNAMENTS_REMOVED"].format(
         sheet_before=SHEET_NAMES['before'], count=len(removed_tids), ids=list(removed_tids)))
-    logger.info(LOG_MESSAGES["MAIN_TOURNAMENTS_COMMON"].format(
+    log.info(LOG_MESSAGES["MAIN_TOURNAMENTS_COMMON"].format(
         count=len(common_tids), ids=list(common_tids)))
 
     # --- Приведение колонок к общему виду ---
@@ -1476,54 +3615,91 @@ def main():
     all_cols += [c for c in set(df_before.columns).union(df_after.columns) if c not in all_cols]
     df_before = df_before.reindex(columns=all_cols)
     df_after = df_after.reindex(columns=all_cols)
-    logger.info(LOG_MESSAGES["MAIN_COLUMNS_ALIGNED"].format(
+    log.info(LOG_MESSAGES["MAIN_COLUMNS_ALIGNED"].format(
         sheet_before=SHEET_NAMES['before'], sheet_after=SHEET_NAMES['after']))
 
     # --- Формируем COMPARE ---
     t_beg_compare = datetime.now()
-    compare_df, sheet_compare = make_compare_sheet(df_before, df_after, SHEET_NAMES['compare'], tid_to_fullname)
+    unchanged_ids = None
+    if COMPARE_SKIP_UNCHANGED_TOURNAMENTS:
+        unchanged_ids = find_unchanged_tournaments(before_digests, after_digests)
+    # Сравнение получает компактные таблицы: align_compare_frames восстанавливает типы только
+    # колонок ключа и сравниваемых строк, полные копии BEFORE/AFTER не создаются
+    compare_df, sheet_compare = make_compare_sheet(
+        df_before, df_after, SHEET_NAMES['compare'], tid_to_fullname, category_transitions, unchanged_ids)
     compare_df = format_compare_dataframe(compare_df, COMPARE_EXPORT_COLUMNS)
     t_end_compare = datetime.now()
-    logger.info(LOG_MESSAGES["MAIN_COMPARE_DONE"].format(
+    log.info(LOG_MESSAGES["MAIN_COMPARE_DONE"].format(
         sheet=sheet_compare, count=len(compare_df)))
     log_compare_stats(compare_df)
+    compare_df = compact_frame(compare_df, SHEET_NAMES['compare'])
 
     # --- Финальная таблица (FINAL) ---
     t_beg_final = datetime.now()
+    # Сотрудники, турниры и участие считаются один раз для FINAL и FINAL_PLACE;
+    # из COMPARE восстанавливаются только колонки, которые читает FinalGrid
+    final_columns = ['tournamentId'] + FinalGrid.EMP_COLS + ['ratingCategoryName_Compare_Best', 'placeInRating_Compare_Best']
+    final_compare_df = restore_frame_dtypes(compare_df[[col for col in final_columns if col in compare_df.columns]])
+    final_grid = FinalGrid(final_compare_df, ALLOWED_TOURNAMENT_IDS, df_before, df_after)
     final_df, tournaments = build_final_sheet_fast(
-        compare_df, ALLOWED_TOURNAMENT_IDS, "FINAL_", CATEGORY_RANK_MAP, df_before, df_after, logger, sheet_name=SHEET_NAMES['final']
+        final_compare_df, ALLOWED_TOURNAMENT_IDS, "FINAL_", CATEGORY_RANK_MAP, df_before, df_after, log, sheet_name=SHEET_NAMES['final'],
+        grid=final_grid
     )
-    logger.info(LOG_MESSAGES["MAIN_FINAL_DONE"].format(
+    log.info(LOG_MESSAGES["MAIN_FINAL_DONE"].format(
         sheet=SHEET_NAMES['final'], shape=final_df.shape))
 
     # Финальная таблица по place (FINAL_PLACE)
     final_place_df, tournaments_place = build_final_place_sheet_from_compare(
-        compare_df, ALLOWED_TOURNAMENT_IDS, df_before, df_after, logger, sheet_name=SHEET_NAMES['final_place']
+        final_compare_df, ALLOWED_TOURNAMENT_IDS, df_before, df_after, log, sheet_name=SHEET_NAMES['final_place'],
+        grid=final_grid
     )
-    logger.info(LOG_MESSAGES["MAIN_FINAL_PLACE_DONE"].format(
+    del final_compare_df, final_grid
+    log.info(LOG_MESSAGES["MAIN_FINAL_PLACE_DONE"].format(
         sheet=SHEET_NAMES['final_place'], shape=final_place_df.shape))
     t_end_final = datetime.now()
 
     # --- Подсчет TOP-3 и групп (группы только для FINAL) ---
     final_df_stat, final_status_names, final_group_cols = add_status_count_and_top3(
-        final_df, tournaments, FINAL_STATUS_LIST, logger, is_final_place=False
+        final_df, tournaments, FINAL_STATUS_LIST, log, is_final_place=False
     )
-    logger.info(LOG_MESSAGES["MAIN_FINAL_TOP3"].format(sheet=SHEET_NAMES['final']))
+    log.info(LOG_MESSAGES["MAIN_FINAL_TOP3"].format(sheet=SHEET_NAMES['final']))
 
     final_place_df_stat, final_place_status_names, _ = add_status_count_and_top3(
-        final_place_df, tournaments_place, FINAL_PLACE_STATUS_LIST, logger, is_final_place=True
+        final_place_df, tournaments_place, FINAL_PLACE_STATUS_LIST, log, is_final_place=True
     )
-    logger.info(LOG_MESSAGES["MAIN_FINAL_PLACE_TOP3"].format(sheet=SHEET_NAMES['final_place']))
+    log.info(LOG_MESSAGES["MAIN_FINAL_PLACE_TOP3"].format(sheet=SHEET_NAMES['final_place']))
 
     # --- Сборка статистики по статусам и группам ---
-    final_status_dist = get_status_distribution(final_df_stat, FINAL_STATUS_LIST, tournaments)
-    final_place_status_dist = get_status_distribution(final_place_df_stat, FINAL_PLACE_STATUS_LIST, tournaments_place)
-    final_groups_dist = get_group_distribution(final_df_stat, final_group_cols) if final_group_cols else {}
+    return {
+        'df_before': df_before,
+        'df_after': df_after,
+        'compare_df': compare_df,
+        'final_df': final_df,
+        'final_df_stat': final_df_stat,
+        'final_status_names': final_status_names,
+        'tournaments': tournaments,
+        'final_place_df_stat': final_place_df_stat,
+        'final_place_status_names': final_place_status_names,
+        'tournaments_place': tournaments_place,
+        'final_status_dist': get_status_distribution(final_df_stat, FINAL_STATUS_LIST, tournaments),
+        'final_place_status_dist': get_status_distribution(final_place_df_stat, FINAL_PLACE_STATUS_LIST, tournaments_place),
+        'final_groups_dist': get_group_distribution(final_df_stat, final_group_cols) if final_group_cols else {},
+        'compare_seconds': (t_end_compare - t_beg_compare).total_seconds(),
+        'final_seconds': (t_end_final - t_beg_final).total_seconds(),
+    }
 
-    # --- Экспорт в Excel ---
-    base, ext = os.path.splitext(RESULT_EXCEL)
-    result_excel_ts = f"{base}_{ts}{ext}"
-    out_excel = os.path.join(TARGET_DIR, result_excel_ts)
+
+def export_compare_workbook(out_excel, result, tid_to_fullname, log):
+    """
+    Выгрузка результата compare_snapshots в Excel: BEFORE/AFTER, COMPARE, FINAL, FINAL_PLACE и легенда.
+
+    Returns:
+        время выгрузки в секундах
+    """
+    df_before, df_after = result['df_before'], result['df_after']
+    # Коды статусов FINAL/FINAL_PLACE раскодируются в строки только для записи листов
+    final_df_stat, tournaments = restore_frame_dtypes(result['final_df_stat']), result['tournaments']
+    final_place_df_stat, tournaments_place = restore_frame_dtypes(result['final_place_df_stat']), result['tournaments_place']
 
     def export_final_sheet_with_names(writer, df, tournaments, sheet_name):
         df_export = df.copy()
@@ -1544,62 +3720,193 @@ def main():
 
     t_beg_export = datetime.now()
     with pd.ExcelWriter(out_excel, engine='openpyxl') as writer:
-        export_and_log(writer, df_before, SHEET_NAMES['before'], logger, freeze_map)
-        export_and_log(writer, df_after, SHEET_NAMES['after'], logger, freeze_map)
+        if get_raw_sheets_mode() == "skip":
+            log.info(LOG_MESSAGES["MAIN_RAW_SHEETS_SKIPPED"].format(
+                sheets=[SHEET_NAMES['before'], SHEET_NAMES['after']]))
+        else:
+            export_and_log(writer, restore_frame_dtypes(df_before), SHEET_NAMES['before'], log, freeze_map)
+            export_and_log(writer, restore_frame_dtypes(df_after), SHEET_NAMES['after'], log, freeze_map)
 
         # Для COMPARE: удаляем tournamentId только при экспорте
-        compare_export_df = compare_df.copy()
+        compare_export_df = restore_frame_dtypes(result['compare_df']).copy()
         if 'tournamentId' in compare_export_df.columns:
             compare_export_df = compare_export_df.drop(columns=['tournamentId'])
-        export_and_log(writer, compare_export_df, SHEET_NAMES['compare'], logger, freeze_map)
+        compare_export_df = add_compare_summary_for_export(compare_export_df, COMPARE_EXPORT_COLUMNS)
+        export_and_log(writer, compare_export_df, SHEET_NAMES['compare'], log, freeze_map)
 
         # Финальные таблицы с заголовками-названиями турниров
         export_final_sheet_with_names(writer, final_df_stat, tournaments, SHEET_NAMES['final'])
         export_final_sheet_with_names(writer, final_place_df_stat, tournaments_place, SHEET_NAMES['final_place'])
 
-        apply_stat_grp_conditional_formatting(writer, SHEET_NAMES['final'], ('stat_', 'grp_'), log=logger)
-        logger.info(LOG_MESSAGES["MAIN_STAT_COND_FMT"].format(sheet=SHEET_NAMES['final']))
-        apply_stat_grp_conditional_formatting(writer, SHEET_NAMES['final_place'], ('stat_', 'grp_'), log=logger)
-        logger.info(LOG_MESSAGES["MAIN_STAT_COND_FMT"].format(sheet=SHEET_NAMES['final_place']))
+        apply_stat_grp_conditional_formatting(writer, SHEET_NAMES['final'], ('stat_', 'grp_'), log=log)
+        log.info(LOG_MESSAGES["MAIN_STAT_COND_FMT"].format(sheet=SHEET_NAMES['final']))
+        apply_stat_grp_conditional_formatting(writer, SHEET_NAMES['final_place'], ('stat_', 'grp_'), log=log)
+        log.info(LOG_MESSAGES["MAIN_STAT_COND_FMT"].format(sheet=SHEET_NAMES['final_place']))
 
         # Цветовая раскраска
-        apply_status_colors(writer, final_df_stat, SHEET_NAMES['final'], STATUS_COLORS_DICT, tournaments + final_status_names + ['TOP1', 'TOP2', 'TOP3'])
-        logger.info(LOG_MESSAGES["MAIN_COLORS_APPLIED"].format(sheet=SHEET_NAMES['final']))
-        apply_status_colors(writer, final_place_df_stat, SHEET_NAMES['final_place'], STATUS_COLORS_DICT, tournaments_place + final_place_status_names + ['TOP1', 'TOP2', 'TOP3'])
-        logger.info(LOG_MESSAGES["MAIN_COLORS_APPLIED"].format(sheet=SHEET_NAMES['final_place']))
+        apply_status_colors(writer, final_df_stat, SHEET_NAMES['final'], STATUS_COLORS_DICT, tournaments + result['final_status_names'] + ['TOP1', 'TOP2', 'TOP3'])
+        log.info(LOG_MESSAGES["MAIN_COLORS_APPLIED"].format(sheet=SHEET_NAMES['final']))
+        apply_status_colors(writer, final_place_df_stat, SHEET_NAMES['final_place'], STATUS_COLORS_DICT, tournaments_place + result['final_place_status_names'] + ['TOP1', 'TOP2', 'TOP3'])
+        log.info(LOG_MESSAGES["MAIN_COLORS_APPLIED"].format(sheet=SHEET_NAMES['final_place']))
         apply_status_colors(writer, compare_export_df, SHEET_NAMES['compare'], STATUS_COLORS_DICT, COMPARE_COLOR_COLUMNS)
-        logger.info(LOG_MESSAGES["MAIN_COLORS_APPLIED"].format(sheet=SHEET_NAMES['compare']))
+        log.info(LOG_MESSAGES["MAIN_COLORS_APPLIED"].format(sheet=SHEET_NAMES['compare']))
 
         add_status_legend(writer, STATUS_LEGEND_FULL, sheet_name=SHEET_NAMES['status_legend'])
-        logger.info(LOG_MESSAGES["MAIN_LEGEND_ADDED"])
+        log.info(LOG_MESSAGES["MAIN_LEGEND_ADDED"])
 
         try:
             workbook = writer.book
             if SHEET_NAMES['final'] in workbook.sheetnames:
                 workbook.active = workbook.sheetnames.index(SHEET_NAMES['final'])
         except Exception as ex:
-            logger.warning(LOG_MESSAGES["MAIN_FINAL_SET_ACTIVE_SHEET_FAIL"].format(sheet=SHEET_NAMES['final'], ex=ex))
+            log.warning(LOG_MESSAGES["MAIN_FINAL_SET_ACTIVE_SHEET_FAIL"].format(sheet=SHEET_NAMES['final'], ex=ex))
 
-        logger.info(LOG_MESSAGES["MAIN_EXCEL_EXPORT"].format(path=out_excel))
-    t_end_export = datetime.now()
+        log.info(LOG_MESSAGES["MAIN_EXCEL_EXPORT"].format(path=out_excel))
+    return (datetime.now() - t_beg_export).total_seconds()
 
-    # --- Сводка по времени и группам/статусам ---
+
+def log_compare_summary(result, before_seconds, after_seconds, export_seconds, total_seconds, log):
+    """Сводка по времени и группам/статусам одного сравнения (SUMMARY_TEMPLATE_EXT)."""
     summary = SUMMARY_TEMPLATE_EXT.format(
-        tourn=len(tournaments),
-        emps=len(final_df),
-        changes=len(compare_df),
-        t1=(t_end_before - t_beg_before).total_seconds(),
-        t2=(t_end_after - t_beg_after).total_seconds(),
-        t3=(t_end_compare - t_beg_compare).total_seconds(),
-        t4=(t_end_final - t_beg_final).total_seconds(),
-        t5=(t_end_export - t_beg_export).total_seconds(),
-        tt=(t_end_export - t_start).total_seconds(),
-        final_statuses=final_status_dist,
-        final_place_statuses=final_place_status_dist,
-        final_groups=final_groups_dist,
+        tourn=len(result['tournaments']),
+        emps=len(result['final_df']),
+        changes=len(result['compare_df']),
+        t1=before_seconds,
+        t2=after_seconds,
+        t3=result['compare_seconds'],
+        t4=result['final_seconds'],
+        t5=export_seconds,
+        tt=total_seconds,
+        final_statuses=result['final_status_dist'],
+        final_place_statuses=result['final_place_status_dist'],
+        final_groups=result['final_groups_dist'],
+    )
+    log.info(summary)
+
+
+def timeline_pairs(count, first_to_last=None):
+    """
+    Пары выгрузок режима динамики: соседние (0-1, 1-2, ...) и, при first_to_last,
+    первая с последней (если она не совпадает с единственной соседней парой).
+    """
+    if first_to_last is None:
+        first_to_last = TIMELINE_FIRST_TO_LAST
+    pairs = [(i, i + 1) for i in range(count - 1)]
+    if first_to_last and count > 2:
+        pairs.append((0, count - 1))
+    return pairs
+
+
+def run_timeline(filenames, tid_to_fullname, category_transitions, log):
+    """
+    Режим динамики: сравнение упорядоченного списка выгрузок за один запуск.
+
+    Каждая выгрузка разбирается один раз и освобождается, как только ни одна из оставшихся
+    пар её не использует (в памяти одновременно не больше трёх выгрузок: первая хранится
+    до пары «первая — последняя»). Для каждой пары из timeline_pairs строится отдельная
+    книга Excel с теми же листами, что в обычном режиме.
+    """
+    t_start = datetime.now()
+    ts = t_start.strftime("%Y%m%d_%H%M%S")
+    base, ext = os.path.splitext(RESULT_EXCEL)
+    paths = [os.path.join(SOURCE_DIR, name) for name in filenames]
+    pairs = timeline_pairs(len(paths))
+    last_use = {}
+    for pair_no, pair in enumerate(pairs):
+        for index in pair:
+            last_use[index] = pair_no
+    log.info(LOG_MESSAGES["TIMELINE_START"].format(files=len(paths), pairs=len(pairs)))
+
+    tournament_filter = get_tournament_filter()
+    snapshots = {}
+    for pair_no, (i, j) in enumerate(pairs, 1):
+        t_pair = datetime.now()
+        log.info(LOG_MESSAGES["TIMELINE_PAIR_START"].format(
+            pair=pair_no, pairs=len(pairs), before=filenames[i], after=filenames[j]))
+        missing = [index for index in (i, j) if index not in snapshots]
+        frames, load_seconds = {}, {}
+        if PARALLEL_LOAD and missing:
+            frames, load_seconds = process_json_files_parallel([paths[index] for index in missing], tournament_filter)
+        for index in missing:
+            path = paths[index]
+            preloaded = (frames.pop(path), load_seconds.get(path, 0.0)) if path in frames else None
+            snapshots[index] = load_snapshot(path, filenames[index], tid_to_fullname, tournament_filter, log, preloaded)
+        # Время загрузки в сводке — только для выгрузок, прочитанных для этой пары
+        before_seconds = snapshots[i][2] if i in missing else 0.0
+        after_seconds = snapshots[j][2] if j in missing else 0.0
+
+        result = compare_snapshots(snapshots[i][0], snapshots[j][0], snapshots[i][1], snapshots[j][1],
+                                   tid_to_fullname, category_transitions, log)
+        before_stem = os.path.splitext(filenames[i])[0]
+        after_stem = os.path.splitext(filenames[j])[0]
+        out_excel = os.path.join(TARGET_DIR, f"{base}_{ts}_{pair_no:02d}_{before_stem}__{after_stem}{ext}")
+        export_seconds = export_compare_workbook(out_excel, result, tid_to_fullname, log)
+        log_compare_summary(result, before_seconds, after_seconds, export_seconds,
+                            (datetime.now() - t_pair).total_seconds(), log)
+        del result
+
+        # Выгрузки, которые больше не нужны ни одной паре, освобождаются
+        for index in [index for index in snapshots if last_use[index] < pair_no]:
+            del snapshots[index]
+            log.info(LOG_MESSAGES["TIMELINE_SNAPSHOT_RELEASED"].format(name=filenames[index]))
+    log.info(LOG_MESSAGES["TIMELINE_DONE"].format(
+        pairs=len(pairs), seconds=(datetime.now() - t_start).total_seconds()))
+
+
+def main():
+    """Основная точка входа в программу."""
+    logger = setup_logger(LOG_DIR, LOG_BASENAME)
+    # Таблица переходов категорий проверяется до загрузки данных: пропуск в lookup — ошибка запуска
+    category_transitions = CategoryTransitions()
+
+    # === Загрузка справочников и подготовка соответствия TournamentID → FULL_NAME ===
+    tid_to_fullname = build_tournament_fullname_map(
+        CATALOG_DIR, TOURNAMENT_SCHEDULE_CSV, CONTEST_DATA_CSV
     )
-    logger.info(summary)
+    logger.info(LOG_MESSAGES["MAIN_TOURNAMENT_DESCRIPTIONS_LOADED"].format(count=len(tid_to_fullname)))
+    log_json_backend()
+
+    # Режим динамики: справочники и таблица переходов общие для всех пар
+    if len(TIMELINE_FILENAMES) >= 2:
+        run_timeline(TIMELINE_FILENAMES, tid_to_fullname, category_transitions, logger)
+        return
+
+    t_start = datetime.now()
+    now = datetime.now()
+    ts = now.strftime("%Y%m%d_%H%M%S")
+
+    # --- Загрузка данных ---
+    before_path = os.path.join(SOURCE_DIR, BEFORE_FILENAME)
+    after_path = os.path.join(SOURCE_DIR, AFTER_FILENAME)
+    if JSON_BACKEND_BENCHMARK:
+        benchmark_json_backends(before_path)
+    # При параллельной загрузке оба файла разбираются заранее, время загрузки учитывается в сводке
+    frames, load_seconds = {}, {}
+    # Турниры вне ALLOWED_TOURNAMENT_IDS отбрасываются при разборе, если листы BEFORE/AFTER фильтруются
+    tournament_filter = get_tournament_filter()
+    if PARALLEL_LOAD:
+        frames, load_seconds = process_json_files_parallel([before_path, after_path], tournament_filter)
+
+    df_before, before_digests, before_seconds = load_snapshot(
+        before_path, SHEET_NAMES['before'], tid_to_fullname, tournament_filter, logger,
+        (frames.pop(before_path), load_seconds.get(before_path, 0.0)) if before_path in frames else None)
+    df_after, after_digests, after_seconds = load_snapshot(
+        after_path, SHEET_NAMES['after'], tid_to_fullname, tournament_filter, logger,
+        (frames.pop(after_path), load_seconds.get(after_path, 0.0)) if after_path in frames else None)
+
+    result = compare_snapshots(df_before, df_after, before_digests, after_digests,
+                               tid_to_fullname, category_transitions, logger)
+
+    # --- Экспорт в Excel ---
+    base, ext = os.path.splitext(RESULT_EXCEL)
+    result_excel_ts = f"{base}_{ts}{ext}"
+    out_excel = os.path.join(TARGET_DIR, result_excel_ts)
+    export_seconds = export_compare_workbook(out_excel, result, tid_to_fullname, logger)
+
+    # --- Сводка по времени и группам/статусам ---
+    log_compare_summary(result, before_seconds, after_seconds, export_seconds,
+                        (datetime.now() - t_start).total_seconds(), logger)
 
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()